@@ -0,0 +1,87 @@
+'''
+中图分类号解析的基准测试。
+
+对比逐级正则规则树（Parser.parse_code_by_regex）与前缀索引（Parser.parse_code）：
+冷启动时构建规则所需的时间、单个分类号的平均解析耗时，以及两者解析结果是否一致。
+需要 src/data_wrapper.py 中的分类树数据。
+
+用法：
+
+    python benchmarks/bench_clc_parser.py [-n 次数] [codes.txt]
+'''
+import argparse
+import importlib
+import os
+import sys
+import time
+import types
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.join(HERE, '..', 'src')
+
+# 常见分类号样例
+SAMPLE_CODES = [
+    'A', 'O1-62', 'J523.2"17"+3:G5', 'TP312', 'TP311.133.1', 'TP338',
+    'K837.125.6(202)+R173:G25a', '[X-019]', 'F08:G40-054', 'K876.3=49', 'G49a',
+    'K825.2；E251-53', 'I287.8', 'I712.45', 'I611.65', 'K854-53', 'F0-0', '{D922.59}',
+    'H319.4', 'I247.5', 'TP18', 'R473.2', 'D669.3', 'B84-49', 'G623.31',
+]
+
+
+def load_clc_parser():
+    '''
+    只加载 clc_parser 及其依赖的 data_wrapper，不执行需要Calibre环境的 src/__init__.py。
+    '''
+    package = types.ModuleType('nlcisbn')
+    package.__path__ = [SRC]
+    sys.modules['nlcisbn'] = package
+    return importlib.import_module('nlcisbn.clc_parser')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('codes', nargs='?', help='分类号列表文件，每行一个，默认使用内置样例')
+    parser.add_argument('-n', '--number', type=int, default=200, help='每个分类号重复解析的次数')
+    args = parser.parse_args(argv)
+
+    if args.codes:
+        with open(args.codes, encoding='utf-8') as f:
+            raw_codes = [line.strip() for line in f if line.strip()]
+    else:
+        raw_codes = SAMPLE_CODES
+
+    clc_parser = load_clc_parser()
+    # 导入 clc_parser 时分类树尚未加载，load_tree 首次调用才真正导入 data_wrapper
+    start = time.perf_counter()
+    clc_parser.load_tree()
+    print(f'导入分类树数据: {(time.perf_counter() - start) * 1000:8.1f} ms')
+
+    Parser = clc_parser.Parser
+    start = time.perf_counter()
+    instance = Parser.get_instance()
+    print(f'构建前缀索引:   {(time.perf_counter() - start) * 1000:8.1f} ms')
+    start = time.perf_counter()
+    instance.clc_tree_regex
+    print(f'构建正则规则树: {(time.perf_counter() - start) * 1000:8.1f} ms')
+
+    codes = [code.strip() for raw in raw_codes for code in raw.replace('；', ';').split(';') if code.strip()]
+    mismatches = 0
+    for code in codes:
+        by_index = instance.parse_code(code)
+        by_regex = instance.parse_code_by_regex(code)
+        if by_index != by_regex:
+            mismatches += 1
+            print(f'  结果不同 {code}: 前缀索引 {by_index}, 正则规则树 {by_regex}')
+    print(f'{len(codes)} 个分类号中 {mismatches} 个结果不同')
+
+    for name, func in (('正则规则树', instance.parse_code_by_regex), ('前缀索引', instance.parse_code)):
+        start = time.perf_counter()
+        for _ in range(args.number):
+            for code in codes:
+                func(code)
+        elapsed = time.perf_counter() - start
+        print(f'{name}: 平均 {elapsed / (args.number * len(codes)) * 1e6:8.2f} µs/个')
+
+
+if __name__ == '__main__':
+    main()
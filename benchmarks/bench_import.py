@@ -0,0 +1,124 @@
+'''
+插件导入耗时的基准测试。
+
+在全新的Python进程中以 -X importtime 导入插件，统计导入耗时（取多次运行的中位数）及自身耗时最多的模块。
+可通过 --baseline 指定一个git版本，导出该版本的 src 目录后做同样的测量，对比前后差异。
+
+默认导入整个插件（需要能导入calibre的Python环境）；无法导入calibre时，只导入指定的子模块。
+
+用法：
+
+    python benchmarks/bench_import.py [--baseline 版本] [--module 子模块] [-r 次数]
+'''
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.abspath(os.path.join(HERE, '..'))
+SRC = os.path.join(ROOT, 'src')
+
+BOOTSTRAP = '''
+import importlib, importlib.util, os, sys, time, types
+src, module = sys.argv[1], sys.argv[2]
+start = time.perf_counter()
+if module == 'plugin':
+    spec = importlib.util.spec_from_file_location('nlcisbn', os.path.join(src, '__init__.py'),
+                                                  submodule_search_locations=[src])
+    package = importlib.util.module_from_spec(spec)
+    sys.modules['nlcisbn'] = package
+    spec.loader.exec_module(package)
+else:
+    package = types.ModuleType('nlcisbn')
+    package.__path__ = [src]
+    sys.modules['nlcisbn'] = package
+    importlib.import_module('nlcisbn.' + module)
+print((time.perf_counter() - start) * 1000)
+'''
+
+
+def has_calibre():
+    result = subprocess.run([sys.executable, '-c', 'import calibre'], capture_output=True)
+    return result.returncode == 0
+
+
+def parse_importtime(stderr):
+    '''
+    解析 -X importtime 的输出。
+    :return: [(自身耗时us, 累计耗时us, 模块名)]
+    '''
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        parts = line[len('import time:'):].split('|')
+        try:
+            entries.append((int(parts[0]), int(parts[1]), parts[2].strip()))
+        except (ValueError, IndexError):
+            continue
+    return entries
+
+
+def measure(src, module, repeat):
+    '''
+    :return: (导入耗时中位数ms, 最后一次运行的importtime条目)
+    '''
+    times = []
+    entries = []
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', BOOTSTRAP, src, module],
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip().splitlines()[-1])
+        times.append(float(result.stdout.strip().splitlines()[-1]))
+        entries = parse_importtime(result.stderr)
+    return statistics.median(times), entries
+
+
+def export_baseline(rev, target):
+    '''
+    导出指定版本的 src 目录。data_wrapper.py 等未纳入版本控制的数据文件从当前目录复制。
+    '''
+    archive = subprocess.run(['git', '-C', ROOT, 'archive', rev, 'src'], capture_output=True, check=True)
+    subprocess.run(['tar', '-x', '-C', target], input=archive.stdout, check=True)
+    src = os.path.join(target, 'src')
+    for name in os.listdir(SRC):
+        if name.endswith('.py') and not os.path.exists(os.path.join(src, name)):
+            shutil.copy(os.path.join(SRC, name), src)
+    return src
+
+
+def report(name, elapsed, entries, top):
+    print(f'[{name}] 导入耗时: {elapsed:8.1f} ms')
+    for self_us, cumulative_us, module in sorted(entries, reverse=True)[:top]:
+        print(f'    自身 {self_us / 1000:8.1f} ms  累计 {cumulative_us / 1000:8.1f} ms  {module}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--baseline', help='对比的git版本，如 HEAD~1')
+    parser.add_argument('--module', help='导入的子模块，默认为整个插件（plugin），无calibre时为clc_parser')
+    parser.add_argument('-r', '--repeat', type=int, default=5, help='重复运行次数')
+    parser.add_argument('--top', type=int, default=10, help='列出自身耗时最多的模块数')
+    args = parser.parse_args(argv)
+
+    module = args.module or ('plugin' if has_calibre() else 'clc_parser')
+    print(f'导入目标: {module}')
+
+    elapsed, entries = measure(SRC, module, args.repeat)
+    report('当前版本', elapsed, entries, args.top)
+
+    if args.baseline:
+        with tempfile.TemporaryDirectory() as target:
+            baseline_src = export_baseline(args.baseline, target)
+            baseline_elapsed, baseline_entries = measure(baseline_src, module, args.repeat)
+        report(args.baseline, baseline_elapsed, baseline_entries, args.top)
+        print(f'导入耗时变化: {baseline_elapsed:.1f} ms -> {elapsed:.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,440 @@
+'''
+基于本地模拟OPAC的端到端基准测试。
+
+在本机启动一个模拟国家图书馆OPAC的HTTP服务，提供会话页面、检索简要列表和全记录页面（默认使用 fixtures 目录下的页面，
+也可通过 --archive 使用插件录制的原始页面存档），并可注入延迟、5xx错误、拦截页面和会话过期。
+插件通过系统HTTP代理设置把发往 opac.nlc.cn 的请求转发到模拟服务，无需修改任何代码。
+
+以指定并发数驱动 isbn2meta、title2metadata 或 NLCISBNPlugin.identify，统计：
+吞吐量（次/秒与HTTP请求/秒）、单次调用延迟的 p50/p95/p99、每条记录的CPU时间与传输量以及内存峰值。
+
+需要能导入calibre的Python环境：
+
+    calibre-debug -e benchmarks/bench_mock_opac.py -- [--scenario replay,isbn,title,index,identify-isbn,identify-title]
+        [-n 次数] [-c 并发数] [--latency 毫秒] [--error-rate 比例] [--engine sync|async] [--gzip]
+
+场景 index 使用临时的本地题名索引，经模拟OPAC检索一次写入记录后，只计时本地索引的检索（title2local）。
+场景 replay 不计时：先以录制模式进行一次ISBN检索和标题检索，再以回放模式重复，
+检查两次结果一致且回放时没有向模拟OPAC发出请求。
+'''
+import argparse
+import glob
+import gzip
+import http.server
+import importlib.util
+import os
+import queue
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.join(HERE, '..', 'src')
+FIXTURES = os.path.join(HERE, 'fixtures')
+
+SESSION_ID = 'MOCKSESSION00001'
+BLOCK_PAGE = '<html><body>访问过于频繁，请稍后再试</body></html>'
+EXPIRED_PAGE = '<html><body>会话已超时，请重新登录</body></html>'
+NOT_FOUND_PAGE = '<html><body>没有找到相关记录</body></html>'
+TITLE = '凤凰架构'
+AUTHORS = ['周志明']
+
+
+class MockOPAC:
+    '''
+    模拟OPAC的页面来源与故障注入设置。
+    '''
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, block_rate=0.0, expire_rate=0.0, archive=None,
+                 compress=False):
+        '''
+        :param latency: 每个响应的固定延迟（单位：秒）。
+        :param jitter: 在固定延迟之上叠加的随机延迟上限（单位：秒）。
+        :param error_rate: 返回503的比例。
+        :param block_rate: 返回拦截页面的比例。
+        :param expire_rate: 检索请求返回会话过期页面的比例。
+        :param archive: 可选的 ResponseArchive，优先从中读取页面。
+        :param compress: 请求头接受gzip时是否压缩响应。
+        '''
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.block_rate = block_rate
+        self.expire_rate = expire_rate
+        self.archive = archive
+        self.compress = compress
+        self.requests = 0
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+        self._random = random.Random(0)
+
+        self.records = {}
+        for path in sorted(glob.glob(os.path.join(FIXTURES, 'full_record_*.html'))):
+            isbn = re.search(r'full_record_(\w+)\.html', path).group(1)
+            with open(path, encoding='utf-8') as f:
+                self.records[isbn] = f.read()
+        self.record_list = list(self.records.values())
+        # MARC格式（format=001）的全记录，没有对应页面时使用标准格式
+        self.marc_list = []
+        for isbn, html in self.records.items():
+            path = os.path.join(FIXTURES, f'marc_record_{isbn}.html')
+            if os.path.exists(path):
+                with open(path, encoding='utf-8') as f:
+                    html = f.read()
+            self.marc_list.append(html)
+        with open(os.path.join(FIXTURES, 'search_list_title.html'), encoding='utf-8') as f:
+            self.search_list = f.read()
+
+    def roll(self):
+        with self._lock:
+            self.requests += 1
+            return self._random.random()
+
+    def page(self, url):
+        '''
+        :param url: 请求的完整URL。
+        :return: (状态码, 页面HTML)
+        '''
+        if self.archive is not None:
+            html = self.archive.get(url)
+            if html is not None:
+                return 200, html
+
+        parts = urllib.parse.urlsplit(url)
+        query = urllib.parse.parse_qs(parts.query)
+        if parts.path.rstrip('/') == '/F':
+            return 200, f'<a href="http://opac.nlc.cn:80/F/{SESSION_ID}?func=file&file_name=find-b">检索</a>'
+        func = query.get('func', [''])[0]
+        if func == 'find-b' and query.get('find_code') == ['ISB']:
+            isbn = query.get('request', [''])[0]
+            if isbn.startswith('0000'):
+                return 200, NOT_FOUND_PAGE
+            serial = re.sub(r'\D', '', isbn)[-6:]
+            return 200, self.records.get(isbn) or self.record_list[int(serial or 0) % len(self.record_list)]
+        if func == 'find-b':
+            return 200, self.search_list
+        if func == 'full-set-set':
+            entry = int(query.get('set_entry', ['1'])[0] or 1)
+            pages = self.marc_list if query.get('format') == ['001'] else self.record_list
+            return 200, pages[entry % len(pages)]
+        return 404, NOT_FOUND_PAGE
+
+
+class MockOPACHandler(http.server.BaseHTTPRequestHandler):
+    '''
+    以HTTP代理的形式接收请求，请求行中为完整URL。
+    '''
+
+    protocol_version = 'HTTP/1.1'
+    opac = None
+
+    def do_GET(self):
+        opac = self.opac
+        dice = opac.roll()
+        delay = opac.latency + (opac.jitter * opac._random.random() if opac.jitter else 0)
+        if delay:
+            time.sleep(delay)
+
+        url = self.path if '://' in self.path else 'http://' + self.headers.get('Host', 'opac.nlc.cn') + self.path
+        is_query = SESSION_ID in url
+        if dice < opac.error_rate:
+            status, html = 503, 'Service Unavailable'
+        elif dice < opac.error_rate + opac.block_rate:
+            status, html = 200, BLOCK_PAGE
+        elif is_query and dice < opac.error_rate + opac.block_rate + opac.expire_rate:
+            status, html = 200, EXPIRED_PAGE
+        else:
+            status, html = opac.page(url)
+
+        body = html.encode('utf-8')
+        gzipped = opac.compress and 'gzip' in (self.headers.get('Accept-Encoding') or '')
+        if gzipped:
+            body = gzip.compress(body)
+        with opac._lock:
+            opac.bytes_sent += len(body)
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        if gzipped:
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server(opac):
+    handler = type('Handler', (MockOPACHandler,), {'opac': opac})
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def use_proxy(port):
+    '''
+    让插件通过系统代理设置把请求发往模拟服务。
+    '''
+    proxy = f'http://127.0.0.1:{port}'
+    for name in ('http_proxy', 'HTTP_PROXY'):
+        os.environ[name] = proxy
+    for name in ('no_proxy', 'NO_PROXY'):
+        os.environ.pop(name, None)
+
+
+def load_plugin():
+    spec = importlib.util.spec_from_file_location('nlcisbn', os.path.join(SRC, '__init__.py'),
+                                                  submodule_search_locations=[SRC])
+    package = importlib.util.module_from_spec(spec)
+    sys.modules['nlcisbn'] = package
+    spec.loader.exec_module(package)
+    return package
+
+
+class QuietLog:
+    '''
+    丢弃所有日志，避免输出影响计时。
+    '''
+
+    def __getattr__(self, name):
+        return self
+
+    def __call__(self, *args, **kwargs):
+        pass
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(p / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def make_plugin(package, args):
+    plugin = package.NLCISBNPlugin(None)
+    prefs = {option.name: option.default for option in plugin.options}
+    prefs.update({
+        'max_workers': args.workers,
+        'request_rate': args.rate,
+        'max_request_rate': args.rate,
+        'enable_cache': False,
+        'enable_local_index': False,
+        'archive_mode': 'off',
+        'use_async_engine': args.engine == 'async',
+    })
+    # 使用独立的设置，不读写用户的插件配置
+    plugin._config_obj = prefs
+    return plugin
+
+
+def make_call(scenario, package, opac, args, plugin):
+    '''
+    :return: 执行一次调用的函数，参数为调用序号，返回得到的记录数。
+    '''
+    log = QuietLog()
+    if args.engine == 'async':
+        from nlcisbn import async_engine as engine
+    else:
+        engine = package
+
+    known_isbns = list(opac.records)
+
+    def isbn_for(i):
+        # 一半为fixtures中已有的ISBN，其余为按序号生成的有效ISBN
+        if i % 2 == 0:
+            return known_isbns[i // 2 % len(known_isbns)]
+        body = f'978711{i % 1000000:06d}'
+        return body + str((10 - sum(int(c) * (1 if k % 2 == 0 else 3) for k, c in enumerate(body)) % 10) % 10)
+
+    def clean(mi):
+        pass
+
+    if scenario == 'isbn':
+        return lambda i: 1 if engine.isbn2meta(isbn_for(i), log, cache=None) else 0
+    if scenario == 'title':
+        return lambda i: len(engine.title2metadata(TITLE, log, queue.Queue(), clean, max_workers=args.workers,
+                                                   authors=AUTHORS, timeout=args.timeout))
+    if scenario == 'index':
+        # 先经模拟OPAC检索一次，把全记录写入索引，之后只计时本地索引的检索
+        engine.title2metadata(TITLE, log, queue.Queue(), clean, max_workers=args.workers, authors=AUTHORS,
+                              timeout=args.timeout)
+        return lambda i: len(package.title2local(TITLE, log, queue.Queue(), clean, authors=AUTHORS))
+
+    def identify(i):
+        results = queue.Queue()
+        if scenario == 'identify-isbn':
+            plugin.identify(log, results, threading.Event(), identifiers={'isbn': isbn_for(i)}, timeout=args.timeout)
+        else:
+            plugin.identify(log, results, threading.Event(), title=TITLE, authors=AUTHORS, timeout=args.timeout)
+        return results.qsize()
+    return identify
+
+
+def check_replay(package, opac, args):
+    '''
+    录制一次ISBN检索与标题检索，再以回放模式重复，检查结果一致且回放时不访问模拟OPAC。
+    :return: 是否通过。
+    '''
+    log = QuietLog()
+    if args.engine == 'async':
+        from nlcisbn import async_engine as engine
+    else:
+        engine = package
+    isbn = next(iter(opac.records))
+
+    def lookup():
+        metadatas = engine.title2metadata(TITLE, log, queue.Queue(), lambda mi: None, max_workers=args.workers,
+                                          authors=AUTHORS, timeout=args.timeout)
+        mi = engine.isbn2meta(isbn, log, cache=None)
+        return sorted(mi.title for mi in metadatas), mi.title if mi else None
+
+    path = os.path.join(tempfile.mkdtemp(prefix='nlcisbn-replay-'), 'archive.sqlite')
+    try:
+        package.ResponseArchive.activate(path)
+        recorded = lookup()
+        package.ResponseArchive.activate(path, replay=True)
+        requests_before = opac.requests
+        try:
+            replayed = lookup()
+        except Exception as e:
+            replayed = e
+        requests = opac.requests - requests_before
+    finally:
+        package.ResponseArchive.deactivate()
+
+    ok = bool(recorded[0]) and recorded == replayed and requests == 0
+    print(f'[replay] 引擎 {args.engine}: ' + ('通过' if ok else '失败'))
+    print(f'  录制: 标题检索 {len(recorded[0])} 条, ISBN检索 {recorded[1]!r}')
+    print(f'  回放: {replayed!r}，向模拟OPAC发出 {requests} 个请求')
+    return ok
+
+
+def run_scenario(scenario, package, opac, args):
+    if scenario == 'replay':
+        if not check_replay(package, opac, args):
+            sys.exit(1)
+        return
+    package.RateLimiter.get_instance().configure(rate=args.rate, max_rate=args.rate)
+    plugin = make_plugin(package, args)
+    if scenario == 'index':
+        # 使用临时索引，不读写用户的本地索引
+        package.RecordIndex.activate(os.path.join(tempfile.mkdtemp(prefix='nlcisbn-index-'), 'index.sqlite'))
+    try:
+        measure(scenario, package, opac, args, plugin)
+    finally:
+        package.RecordIndex.deactivate()
+
+
+def measure(scenario, package, opac, args, plugin):
+    call = make_call(scenario, package, opac, args, plugin)
+    # 预热：建立会话与连接
+    try:
+        call(0)
+    except Exception:
+        pass
+
+    latencies = []
+    records = 0
+    errors = 0
+    lock = threading.Lock()
+
+    def timed(i):
+        nonlocal records, errors
+        start = time.perf_counter()
+        try:
+            count = call(i)
+            failed = False
+        except Exception:
+            count = 0
+            failed = True
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            records += count
+            errors += failed
+
+    if args.memory:
+        tracemalloc.start()
+    requests_before = opac.requests
+    bytes_before = opac.bytes_sent
+    cpu_before = time.process_time()
+    wall_before = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(timed, range(1, args.number + 1)))
+    wall = time.perf_counter() - wall_before
+    cpu = time.process_time() - cpu_before
+    requests = opac.requests - requests_before
+    sent = opac.bytes_sent - bytes_before
+    if args.memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        memory = f'Python分配峰值 {peak / 1024 / 1024:.1f} MiB'
+    else:
+        memory = f'进程内存峰值 {peak_rss() / 1024 / 1024:.1f} MiB'
+
+    latencies.sort()
+    print(f'[{scenario}] {args.number} 次调用, 并发 {args.concurrency}, 引擎 {args.engine}')
+    print(f'  吞吐量:   {args.number / wall:8.1f} 次/秒   {requests / wall:8.1f} HTTP请求/秒   '
+          f'(共 {requests} 个请求, {records} 条记录, {errors} 次失败)')
+    print(f'  延迟:     p50 {percentile(latencies, 50) * 1000:8.1f} ms   p95 {percentile(latencies, 95) * 1000:8.1f} ms   '
+          f'p99 {percentile(latencies, 99) * 1000:8.1f} ms')
+    print(f'  CPU时间:  {cpu / max(records, 1) * 1000:8.2f} ms/条记录   {memory}')
+    print(f'  传输量:   {sent / max(records, 1) / 1024:8.1f} KiB/条记录   (共 {sent / 1024 / 1024:.1f} MiB)')
+
+
+def peak_rss():
+    '''
+    :return: 进程内存峰值（字节），无法获取时为0。
+    '''
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 以字节为单位，Linux 以KiB为单位
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenario', default='replay,isbn,title,index,identify-isbn,identify-title',
+                        help='要运行的场景，以逗号分隔：replay、isbn、title、index、identify-isbn、identify-title')
+    parser.add_argument('-n', '--number', type=int, default=200, help='每个场景的调用次数')
+    parser.add_argument('-c', '--concurrency', type=int, default=4, help='同时进行的调用数')
+    parser.add_argument('--workers', type=int, default=2, help='插件的最大线程数（连接池大小）')
+    parser.add_argument('--rate', type=float, default=0, help='插件的请求速率（次/秒），0表示不限速')
+    parser.add_argument('--engine', choices=('sync', 'async'), default='sync', help='查询引擎')
+    parser.add_argument('--timeout', type=float, default=30, help='单次标题检索的超时时间（秒）')
+    parser.add_argument('--latency', type=float, default=20, help='每个响应的固定延迟（毫秒）')
+    parser.add_argument('--jitter', type=float, default=10, help='叠加的随机延迟上限（毫秒）')
+    parser.add_argument('--error-rate', type=float, default=0, help='返回503的比例')
+    parser.add_argument('--block-rate', type=float, default=0, help='返回拦截页面的比例')
+    parser.add_argument('--expire-rate', type=float, default=0, help='检索请求返回会话过期页面的比例')
+    parser.add_argument('--archive', help='使用插件录制的原始页面存档作为页面来源')
+    parser.add_argument('--gzip', action='store_true', help='请求头接受gzip时压缩响应')
+    parser.add_argument('--memory', action='store_true', help='用tracemalloc统计Python内存分配峰值（会降低吞吐量）')
+    args = parser.parse_args(argv)
+
+    opac = MockOPAC(args.latency / 1000, args.jitter / 1000, args.error_rate, args.block_rate, args.expire_rate,
+                    compress=args.gzip)
+    server = start_server(opac)
+    use_proxy(server.server_port)
+    package = load_plugin()
+    if args.archive:
+        from nlcisbn.archive import ResponseArchive
+        opac.archive = ResponseArchive(args.archive)
+
+    for scenario in args.scenario.split(','):
+        run_scenario(scenario.strip(), package, opac, args)
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
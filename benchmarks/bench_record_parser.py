@@ -0,0 +1,112 @@
+'''
+OPAC页面解析的基准测试。
+
+对比原先基于 BeautifulSoup(html.parser) 的解析与 opac_parser 中的流式解析：
+全记录表格（parse_record_table）与简要列表（parse_search_page）。
+先检查两者对 fixtures 目录下所有页面的解析结果一致，再分别统计每秒可解析的页面数。
+
+用法：
+
+    python benchmarks/bench_record_parser.py [-n 次数]
+'''
+import argparse
+import glob
+import os
+import sys
+import time
+
+from bs4 import BeautifulSoup
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'src'))
+
+from opac_parser import parse_record_table, parse_search_page  # noqa: E402
+
+FIXTURES = sorted(glob.glob(os.path.join(HERE, 'fixtures', 'full_record_*.html')))
+LIST_FIXTURES = sorted(glob.glob(os.path.join(HERE, 'fixtures', 'search_list_*.html')))
+# 标题检索默认最多取多少条
+LIST_LIMIT = 6
+
+
+def parse_with_soup(html):
+    '''
+    原先 get_parse_metadata 中的表格遍历方式。
+    '''
+    soup = BeautifulSoup(html, "html.parser")
+    table = soup.find("table", attrs={"id": "td"})
+    if not table:
+        return None
+    rows = []
+    for tr in table.find_all('tr'):
+        td_elements = tr.find_all('td', class_='td1')
+        rows.append([td.get_text(strip=True) for td in td_elements])
+    return rows
+
+
+def parse_with_stream(html):
+    return parse_record_table(html)
+
+
+def parse_list_with_soup(html):
+    '''
+    原先 parse_search_list 的解析方式（解析全部条目后再截断）。
+    '''
+    soup = BeautifulSoup(html, "html.parser")
+    titlelist = []
+    for itemtitle_element in soup.find_all('div', class_='itemtitle'):
+        titlelist.append([itemtitle_element.get_text(), itemtitle_element.find('a')['href']])
+    return titlelist[:LIST_LIMIT]
+
+
+def parse_list_with_stream(html):
+    return parse_search_page(html, LIST_LIMIT)[0]
+
+
+def check_equivalence(pages, expected_func, actual_func):
+    ok = True
+    for path, html in pages:
+        expected = expected_func(html)
+        actual = actual_func(html)
+        if expected != actual:
+            ok = False
+            print(f'结果不一致: {os.path.basename(path)}')
+            print(f'  BeautifulSoup: {expected}')
+            print(f'  流式解析:      {actual}')
+    return ok
+
+
+def bench(func, pages, number):
+    start = time.perf_counter()
+    for _ in range(number):
+        for _, html in pages:
+            func(html)
+    elapsed = time.perf_counter() - start
+    return number * len(pages) / elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', '--number', type=int, default=200, help='每个页面重复解析的次数')
+    args = parser.parse_args(argv)
+
+    for name, paths, before_func, after_func in (
+            ('全记录', FIXTURES, parse_with_soup, parse_with_stream),
+            ('简要列表', LIST_FIXTURES, parse_list_with_soup, parse_list_with_stream)):
+        pages = []
+        for path in paths:
+            with open(path, encoding='utf-8') as f:
+                pages.append((path, f.read()))
+
+        if not check_equivalence(pages, before_func, after_func):
+            sys.exit(1)
+        print(f'[{name}] {len(pages)} 个页面解析结果一致')
+
+        before = bench(before_func, pages, args.number)
+        after = bench(after_func, pages, args.number)
+        print(f'  BeautifulSoup(html.parser): {before:10.1f} 页/秒')
+        print(f'  流式解析:                    {after:10.1f} 页/秒')
+        print(f'  加速比: {after / before:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
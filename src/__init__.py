@@ -1,26 +1,50 @@
 from calibre.ebooks.metadata.sources.base import Source, Option
 from calibre.ebooks.metadata import MetaInformation
+from calibre.utils.config import config_dir
+import os
 import re
-import urllib.request
-from bs4 import BeautifulSoup
+import urllib.error
 import urllib.parse
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import threading
 import time
 import hashlib
-from random import randint
+import sqlite3
 
 from .clc_parser import Parser
+from .cache import MetadataCache
+from .archive import ResponseArchive
+from .record_index import RecordIndex
+from .metrics import Metrics
+from .retry import RetryPolicy, CircuitBreaker, CircuitOpenError, OPACBlockedError, classify_error, PERMANENT
+from .transport import HTTPTransport
+from .ratelimit import RateLimiter
+from .opac_parser import parse_record_table, parse_search_page
+from .marc_parser import parse_marc_rows
+from .ranking import rank_candidates, normalize_text, NEAR_EXACT_SCORE
+from .record import NLCRecord, MARCRecord
 
 # 常量定义：URL 和头信息
 BASE_URL = "http://opac.nlc.cn/F"
 PROVIDER_ID = "isbn"
-SEARCH_URL_TEMPLATE = BASE_URL + "?func=find-b&find_code=ISB&request={isbn}&local_base=NLC01" + \
-                      "&filter_code_1=WLN&filter_request_1=&filter_code_2=WYR&filter_request_2=" + \
-                      "&filter_code_3=WYR&filter_request_3=&filter_code_4=WFM&filter_request_4=&filter_code_5=WSL&filter_request_5="
-SEARCH_URL_TEMPLATE_TITLE = BASE_URL + "?func=find-b&find_code=WTP&request={title}&local_base=NLC01" + \
-                      "&filter_code_1=WLN&filter_request_1=&filter_code_2=WYR&filter_request_2=" + \
-                      "&filter_code_3=WYR&filter_request_3=&filter_code_4=WFM&filter_request_4=&filter_code_5=WSL&filter_request_5="
+SEARCH_QUERY_TEMPLATE = "?func=find-b&find_code=ISB&request={isbn}&local_base=NLC01" + \
+                        "&filter_code_1=WLN&filter_request_1=&filter_code_2=WYR&filter_request_2=" + \
+                        "&filter_code_3=WYR&filter_request_3=&filter_code_4=WFM&filter_request_4=&filter_code_5=WSL&filter_request_5="
+SEARCH_QUERY_TEMPLATE_TITLE = "?func=find-b&find_code=WTP&request={title}&local_base=NLC01" + \
+                        "&filter_code_1=WLN&filter_request_1=&filter_code_2=WYR&filter_request_2=" + \
+                        "&filter_code_3=WYR&filter_request_3=&filter_code_4=WFM&filter_request_4=&filter_code_5=WSL&filter_request_5="
+SEARCH_URL_TEMPLATE = BASE_URL + SEARCH_QUERY_TEMPLATE
+SEARCH_URL_TEMPLATE_TITLE = BASE_URL + SEARCH_QUERY_TEMPLATE_TITLE
+# 基础页面中带会话号的动态URL
+DYNAMIC_URL_PATTERN = re.compile(r"http://opac.nlc.cn:80/F/[^\s?\"'<>]*")
+# 请求过于频繁被拦截时，OPAC返回的提示页面
+BLOCK_PAGE_PATTERN = re.compile(r'访问过于频繁|请求过于频繁|访问受限|拒绝访问|Access Denied|Too Many Requests', re.IGNORECASE)
+# 全记录链接中的显示格式参数
+RECORD_FORMAT_PATTERN = re.compile(r'([?&]format=)\w+')
+# 会话过期时，OPAC返回的提示页面
+SESSION_EXPIRED_PATTERN = re.compile(r'会话已?(?:超时|过期|失效)|session (?:has )?(?:expired|timed out)', re.IGNORECASE)
 
 HEADERS = {
     'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
@@ -36,7 +60,11 @@ HEADERS = {
 
 MAX_WORKERS = 2
 MAX_TITLE_LIST_NUM = 6
-SPIDER_BASE_SLEEP_TIME = 200
+REQUEST_RATE = 1.0
+MAX_REQUEST_RATE = 3.0
+MAX_RETRIES = 2
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_COOLDOWN = 60
 IS_STRIP_TITLE = True
 IS_STRIP_AUTHOR = True
 IS_NCLHASH = True
@@ -45,26 +73,29 @@ IS_FUZZY_SEARCH_WITH_AUTHOR = True
 ADD_CLC_TO_TAGS = True
 CONVERT_CLC_TO_TAG = True
 CLC_PARSE_LEVEL = 2
+ENABLE_CACHE = True
+CACHE_TTL_DAYS = 30
+CACHE_MAX_ENTRIES = 50000
+CACHE_NEGATIVE_TTL_HOURS = 24
+CACHE_PATH = os.path.join(config_dir, 'plugins', 'nlcisbn_cache.sqlite')
+USE_ASYNC_ENGINE = False
+ARCHIVE_MODE = 'off'
+METRICS_EXPORT_PATH = ''
+ARCHIVE_PATH = os.path.join(config_dir, 'plugins', 'nlcisbn_archive.sqlite')
+ENABLE_LOCAL_INDEX = True
+INDEX_PATH = os.path.join(config_dir, 'plugins', 'nlcisbn_index.sqlite')
+EARLY_STOP_MATCHES = 2
+DUAL_ISBN_LOOKUP = True
+MAX_ISBN_HITS = 10
+# 全记录页面的显示格式：999为标准格式，001为MARC格式
+TABLE_RECORD_FORMAT = '999'
+MARC_RECORD_FORMAT = '001'
+# 下载全记录时使用的显示格式，MARC格式解析失败时改用标准格式重新下载
+RECORD_FORMAT = MARC_RECORD_FORMAT
 
-def spider_sleep():
-    """
-    模拟爬虫睡眠时间。(结果近似正态分布。)
-
-    函数通过模拟掷8个120面的骰子并求和，加上一个随机数和基础睡眠时间，来确定睡眠时间，并使当前线程进入睡眠状态。
-    """
-    sleep_time = sum(randint(1, 120) for _ in range(8))  # 掷3个8到120面的骰子并求和
-    sleep_time = sleep_time + randint(30, 600) + SPIDER_BASE_SLEEP_TIME
-    time.sleep(sleep_time / 1000)
-
-
-def extract_data_info(html):
-    pattern = r"第\s+(\d+)\s+条记录\(共\s+(\d+)\s+条\)"
-    match = re.search(pattern, html)
-    if match:
-        current_record, total_records = match.groups()
-        return int(current_record), int(total_records)
-    else:
-        return None, None
+ISBN_PATTERN = re.compile(r'ISBN: ([\d\-]+)')
+PUBDATE_MONTH_PATTERN = re.compile(r'^\d{4}-\d+$')
+PUBDATE_DAY_PATTERN = re.compile(r'^\d{4}-\d+-\d+$')
 
 def hash_utf8_string(input_string):
     # 将字符串编码为UTF-8
@@ -77,6 +108,92 @@ def hash_utf8_string(input_string):
     # 返回十六进制格式的哈希值
     return hasher.hexdigest()
 
+def download_html(url):
+    '''
+    下载一次页面并解码为文本，不重试。请求速率由全局限速器控制，并根据结果调整。
+    :param url: 页面URL。
+    :return: 页面HTML。
+    '''
+    metrics = Metrics.get_instance()
+    limiter = RateLimiter.get_instance()
+    with metrics.timer('rate_wait'):
+        limiter.acquire()
+    metrics.add('requests')
+    try:
+        with metrics.timer('download'):
+            _, _, body = HTTPTransport.get_instance(HEADERS).get(url)
+    except urllib.error.HTTPError as e:
+        metrics.add('http_errors')
+        if e.code >= 500 or e.code == 429:
+            limiter.on_failure()
+        raise
+    except OSError:
+        # 超时、连接失败等
+        metrics.add('network_errors')
+        limiter.on_failure()
+        raise
+    response_text = body.decode('utf-8')
+    if BLOCK_PAGE_PATTERN.search(response_text):
+        metrics.add('blocked')
+        limiter.on_failure()
+        raise OPACBlockedError("请求过于频繁，已被OPAC拦截")
+    limiter.on_success()
+    return response_text
+
+def fetch_html(url, isbn=None, store=True, log=None, search=None):
+    '''
+    下载页面并解码为文本。启用存档时，录制模式下写入存档，回放模式下直接从存档读取。
+
+    超时、连接失败、5xx、429和拦截页面按指数退避（带随机抖动）重试；连续失败过多时熔断器断开，
+    冷却期内直接抛出 CircuitOpenError，不再等待超时。
+    :param url: 页面URL。
+    :param isbn: 页面对应的ISBN，用于存档索引。
+    :param store: 是否写入存档。
+    :param log: 日志记录器，用于记录重试与熔断状态。
+    :param search: 全记录所属的检索条件（ISBN或标题），用于存档索引。
+    :return: 页面HTML。
+    '''
+    metrics = Metrics.get_instance()
+    archive, replay = ResponseArchive.active()
+    if replay:
+        response_text = archive.get(url, isbn, search)
+        if response_text is None:
+            raise urllib.error.URLError(f"存档中没有该页面: {url}")
+        metrics.add('archive_reads')
+        return response_text
+
+    policy = RetryPolicy.get_instance()
+    breaker = CircuitBreaker.get_instance()
+    attempt = 0
+    while True:
+        try:
+            breaker.before_call(log)
+        except CircuitOpenError:
+            metrics.add('circuit_rejections')
+            raise
+        try:
+            response_text = download_html(url)
+        except Exception as e:
+            if classify_error(e) == PERMANENT:
+                # 服务器有响应，只是请求本身无效
+                breaker.record_success(log)
+                raise
+            if breaker.record_failure(log) or attempt >= policy.max_retries:
+                raise
+            delay = policy.backoff(attempt)
+            attempt += 1
+            metrics.add('retries')
+            if log is not None:
+                log.info(f"请求失败（{e}），{delay:.1f} 秒后第 {attempt} 次重试: {url}")
+            time.sleep(delay)
+            continue
+        breaker.record_success(log)
+        break
+
+    if archive is not None and store:
+        archive.put(url, response_text, isbn, search)
+    return response_text
+
 def get_dynamic_url(log):
     '''
     从基础页面获取动态URL。
@@ -84,79 +201,318 @@ def get_dynamic_url(log):
     :return: 动态URL或None（获取失败时）。
     '''
     
-    response = urllib.request.urlopen(urllib.request.Request(BASE_URL, headers=HEADERS), timeout=10)
-    response_text = response.read().decode('utf-8')
-    dynamic_url_match = re.search(r"http://opac.nlc.cn:80/F/[^\s?]*", response_text)
+    with Metrics.get_instance().timer('session'):
+        return extract_dynamic_url(fetch_html(BASE_URL, store=False, log=log))
+
+def extract_dynamic_url(html):
+    '''
+    从基础页面中提取动态URL。
+    :param html: 基础页面HTML。
+    :return: 动态URL。
+    '''
+    dynamic_url_match = DYNAMIC_URL_PATTERN.search(html)
     if dynamic_url_match:
         dynamic_url = dynamic_url_match.group(0)
         return dynamic_url
     else:
         raise ValueError("无法找到动态URL")
 
-def title2metadata(title, log, result_queue, clean_downloaded_metadata, max_workers=MAX_WORKERS, max_title_list_num=MAX_TITLE_LIST_NUM ):
+class OPACSession:
+    '''
+    OPAC会话管理。
+
+    动态URL（http://opac.nlc.cn:80/F/<会话号>）只在首次使用时获取一次，在所有线程和 identify 调用间共享，
+    检索请求均通过该会话发出；仅当服务器提示会话过期时才重新获取。
+    '''
+
+    # 单例模式
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self._url = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def get_url(self, log):
+        '''
+        获取当前会话的动态URL，尚未建立会话时先获取。
+        :param log: 日志记录器。
+        :return: 动态URL。
+        '''
+        with self._lock:
+            if self._url is None:
+                self._url = get_dynamic_url(log)
+                log.info(f"已建立OPAC会话: {self._url}")
+            return self._url
+
+    def invalidate(self, url):
+        '''
+        使会话失效。若其他线程已经刷新过会话，则不做处理。
+        :param url: 已过期的动态URL。
+        '''
+        with self._lock:
+            if self._url == url:
+                self._url = None
+
+    def fetch(self, query, log, isbn=None):
+        '''
+        通过当前会话发出检索请求，会话过期时自动刷新并重试一次。回放模式下不建立会话，直接从存档读取。
+        :param query: 以“?”开头的查询字符串。
+        :param log: 日志记录器。
+        :param isbn: 检索的ISBN，用于存档索引。
+        :return: 页面HTML。
+        '''
+        if ResponseArchive.active()[1]:
+            return fetch_html(BASE_URL + query, isbn=isbn, log=log)
+        for attempt in range(2):
+            session_url = self.get_url(log)
+            response_text = fetch_html(session_url + query, isbn=isbn, log=log)
+            if attempt == 0 and SESSION_EXPIRED_PATTERN.search(response_text):
+                log.info("OPAC会话已过期，正在刷新...")
+                Metrics.get_instance().add('session_refreshes')
+                self.invalidate(session_url)
+                continue
+            return response_text
+        return response_text
+
+class WorkerPool:
+    '''
+    插件全局共享的线程池，用于并发下载全记录页面。
+
+    线程池在多次 identify 调用间复用，大小随“最大线程数”设置调整。
+    '''
+
+    # 单例模式
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, max_workers=MAX_WORKERS):
+        self.max_workers = max(1, int(max_workers))
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='NLCISBNWorker')
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def resize(self, max_workers):
+        '''
+        调整线程池大小。已提交的任务仍在原线程池中执行完毕。
+        :param max_workers: 线程数。
+        '''
+        max_workers = max(1, int(max_workers))
+        with self._lock:
+            if max_workers == self.max_workers:
+                return
+            old_executor = self.executor
+            self.max_workers = max_workers
+            self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='NLCISBNWorker')
+        old_executor.shutdown(wait=False)
+
+    def submit(self, fn, *args, **kwargs):
+        with self._lock:
+            return self.executor.submit(fn, *args, **kwargs)
+
+def iter_completed(submit, jobs, max_in_flight, log, deadline=None, hold=None):
+    '''
+    按 jobs 的顺序提交任务，按完成顺序逐条产出结果。
+
+    同时进行的任务不超过 max_in_flight，调用方取走一条结果后才补充提交新任务，下载不会跑在下游处理前面，
+    内存占用与候选条目数无关。调用方提前结束迭代并关闭生成器时，取消尚未开始的任务。
+    :param submit: 提交任务的函数，参数为 jobs 中的元素，返回 Future。
+    :param jobs: 待提交的任务列表，从头部依次取出；调用方可在迭代过程中修改。
+    :param max_in_flight: 同时进行的任务数上限。
+    :param log: 日志记录器。
+    :param deadline: time.monotonic() 的截止时间，超过后放弃尚未完成的任务并结束迭代。
+    :param hold: 可选的函数，参数为下一个任务与正在进行的任务列表，返回True时暂缓提交。
+    :return: 生成 (任务, 结果)。
+    '''
+    pending = {}
+    try:
+        while jobs or pending:
+            while jobs and len(pending) < max_in_flight:
+                if hold is not None and hold(jobs[0], list(pending.values())):
+                    break
+                job = jobs.pop(0)
+                pending[submit(job)] = job
+            if not pending:
+                break
+
+            remaining = deadline - time.monotonic() if deadline else None
+            done = None
+            if remaining is None or remaining > 0:
+                done, _ = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            if not done:
+                log.info(f"检索超时，放弃尚未完成的 {len(pending)} 条全记录")
+                return
+            for future in done:
+                yield pending.pop(future), future.result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+def deliver_record(record, log, result_queue, clean_downloaded_metadata):
+    '''
+    将记录转换为元数据，清理后立即放入结果队列。
+    :param record: NLCRecord 对象。
+    :param log: 日志记录器。
+    :param result_queue: 结果队列。
+    :param clean_downloaded_metadata: 清理元数据的函数。
+    :return: 元数据对象。
+    '''
+    metadata = to_metadata(record_to_dict(record), False, log)
+    clean_downloaded_metadata(metadata)
+    result_queue.put(metadata)
+    return metadata
+
+def is_confident_match(metadata, title):
+    '''
+    判断检索结果是否与查询标题高度吻合。
+    :param metadata: 元数据对象。
+    :param title: 查询标题（不含作者）。
+    :return: 标准化后的标题完全一致时为True。
+    '''
+    query = normalize_text(title)
+    return bool(query) and normalize_text(metadata.title) == query
+
+def title2metadata(title, log, result_queue, clean_downloaded_metadata, max_workers=MAX_WORKERS, max_title_list_num=MAX_TITLE_LIST_NUM,
+                   authors=None, abort=None, timeout=None, early_stop_matches=EARLY_STOP_MATCHES):
+    '''
+    根据标题检索，按相关度从高到低并发下载简要列表中的全记录，每得到一条结果就放入 result_queue。
+    :param title: 标题。
+    :param log: 日志记录器。
+    :param result_queue: 结果队列。
+    :param clean_downloaded_metadata: 清理元数据的函数。
+    :param max_workers: 线程池大小。
+    :param max_title_list_num: 最多下载多少条全记录（按相关度从高到低）。
+    :param authors: 作者列表，用于相关度排序；启用“使用作者信息进行模糊搜索”时还会附加到检索词中。
+    :param abort: 可选的 threading.Event，置位后停止下载尚未开始的全记录。
+    :param timeout: 超时时间（单位：秒），超时后放弃尚未完成的全记录。
+    :param early_stop_matches: 得到多少条与标题完全吻合的结果后提前结束，0表示不提前结束。
+    :return: 元数据对象列表。
+    '''
     if not isinstance(title, str):
         raise TypeError("title必须是字符串")
-    
-    title = urllib.parse.quote(f"{title}")
-    dynamic_url = get_dynamic_url(log)
-    if not dynamic_url:
-        return None
 
-    search_url = SEARCH_URL_TEMPLATE_TITLE.format(title=title)
-    
-    response = urllib.request.urlopen(urllib.request.Request(search_url, headers=HEADERS), timeout=10)
+    deadline = time.monotonic() + timeout if timeout else None
+    query = title
+    if IS_FUZZY_SEARCH_WITH_AUTHOR and authors and isinstance(authors, list):
+        query += authors[0]
 
-    response_text = response.read().decode('utf-8')
+    query = urllib.parse.quote(f"{query}")
+    with Metrics.get_instance().timer('search'):
+        response_text = OPACSession.get_instance().fetch(SEARCH_QUERY_TEMPLATE_TITLE.format(title=query), log)
 
-    titlelist = parse_search_list(response_text, log)
-    
-    spider_sleep()
+    titlelist, total = parse_search_list(response_text, log)
+    candidates = rank_candidates(titlelist, title, authors, limit=max_title_list_num, log=log)
+    log.info(f"按相关度保留 {len(candidates)} 条: " + ', '.join(f"{score:.2f}" for score, _, _ in candidates))
+    if abort is not None and abort.is_set():
+        return []
 
-    
-    if len(titlelist)>MAX_TITLE_LIST_NUM:
-        titlelist = titlelist[:MAX_TITLE_LIST_NUM]
-    # 使用线程池处理并发请求
+    # 使用全局线程池下载并解析全记录，按得分从高到低提交，同时进行的下载不超过 max_workers；
+    # 转换、清理和放入结果队列在调用方线程中逐条进行
+    pool = WorkerPool.get_instance()
+    pool.resize(max_workers)
+    results = iter_completed(
+        lambda candidate: pool.submit(url2record, candidate[2], None, log, abort, title), candidates, max_workers, log, deadline,
+        # 先确认几乎一致的条目，再决定是否下载其余条目
+        hold=lambda candidate, running: candidate[0] < NEAR_EXACT_SCORE and any(
+            score >= NEAR_EXACT_SCORE for score, _, _ in running)
+    )
     metadatas = []
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        future_to_url = {executor.submit(url2metadata, item[1], log, result_queue, clean_downloaded_metadata, max_workers= MAX_WORKERS, max_title_list_num= MAX_TITLE_LIST_NUM): item for item in titlelist}
-        for future in as_completed(future_to_url):
-            data = future.result()
-            if data:
-                metadatas.append(data)
+    confident = 0
+    with closing(results):
+        for (score, _, _), record in results:
+            if record is not None:
+                metadata = deliver_record(record, log, result_queue, clean_downloaded_metadata)
+                metadatas.append(metadata)
+                if is_confident_match(metadata, title) or score >= NEAR_EXACT_SCORE:
+                    confident += 1
+                    # 已找到几乎一致的结果后，只继续下载同样几乎一致的条目（如同一书的不同版本）
+                    candidates[:] = [candidate for candidate in candidates if candidate[0] >= NEAR_EXACT_SCORE]
+
+            if abort is not None and abort.is_set():
+                log.info("检索已取消")
+                break
+            if early_stop_matches and confident >= early_stop_matches:
+                log.info(f"已得到 {confident} 条与标题吻合的结果，提前结束")
+                break
     return metadatas
 
-def url2metadata(url, log, result_queue, clean_downloaded_metadata, max_workers= MAX_WORKERS, max_title_list_num= MAX_TITLE_LIST_NUM ):
-    if not isinstance(url, str):
-        raise TypeError("url必须是字符串")
-    search_url = url
-    
-    spider_sleep()
+def title2local(title, log, result_queue, clean_downloaded_metadata, max_title_list_num=MAX_TITLE_LIST_NUM, authors=None):
+    '''
+    根据标题检索本地索引，只有存在与标题几乎一致的记录时才放入 result_queue。
+    :param title: 标题。
+    :param log: 日志记录器。
+    :param result_queue: 结果队列。
+    :param clean_downloaded_metadata: 清理元数据的函数。
+    :param max_title_list_num: 最多返回多少条。
+    :param authors: 作者列表，用于相关度打分。
+    :return: 元数据对象列表，未启用索引或没有足够吻合的记录时为空列表。
+    '''
+    index = RecordIndex.active()
+    if index is None or not isinstance(title, str):
+        return []
+    metrics = Metrics.get_instance()
+    try:
+        with metrics.timer('index'):
+            hits = index.search(title, authors, limit=max_title_list_num)
+    except sqlite3.Error as e:
+        log.error(f"检索本地索引失败: {e}")
+        return []
+    records = [NLCRecord.from_json(data) for _, data in hits]
+    records = [record for record in records if record is not None]
+    if not records:
+        metrics.add('index_misses')
+        return []
+    metrics.add('index_hits')
+    log.info(f"本地索引命中 {len(records)} 条: " + ', '.join(f"{score:.2f}" for score, _ in hits))
+    return [deliver_record(record, log, result_queue, clean_downloaded_metadata) for record in records]
 
+def index_record(record, log):
+    '''
+    将记录写入当前启用的本地索引。
+    :param record: NLCRecord 对象。
+    :param log: 日志记录器。
+    '''
+    index = RecordIndex.active()
+    if index is None:
+        return
     try:
-        response = urllib.request.urlopen(urllib.request.Request(search_url, headers=HEADERS), timeout=10)
-        response_text = response.read().decode('utf-8')
-        metadata = to_metadata(get_parse_metadata(response_text, None, log), False, log)
-        clean_downloaded_metadata(metadata)
-        result_queue.put(metadata)
-        return metadata
-    except:
-        return None
+        index.add(record)
+    except sqlite3.Error as e:
+        log.error(f"写入本地索引失败: {e}")
 
-def parse_search_list(html, log): 
-    soup = BeautifulSoup(html, "html.parser")
-    titlelist = []
-    # 找到所有class为itemtitle的<div>元素
-    itemtitle_elements = soup.find_all('div', class_='itemtitle')
+def url2metadata(url, log, result_queue, clean_downloaded_metadata, max_workers= MAX_WORKERS, max_title_list_num= MAX_TITLE_LIST_NUM, abort=None):
+    if not isinstance(url, str):
+        raise TypeError("url必须是字符串")
+    record = url2record(url, None, log, abort)
+    if record is None:
+        return None
+    return deliver_record(record, log, result_queue, clean_downloaded_metadata)
 
-    # 遍历每个匹配的元素
-    for itemtitle_element in itemtitle_elements:
-        # 获取文本内容
-        itemtitle = itemtitle_element.get_text()
-        
-        # 找到链接<a>标签并获取其href属性值
-        link = itemtitle_element.find('a')['href']
-        titlelist.append([itemtitle,link])
-    return titlelist
+def parse_search_list(html, log, limit=None):
+    '''
+    解析标题检索的简要列表页面。
+    :param html: 简要列表页面HTML。
+    :param log: 日志记录器。
+    :param limit: 最多收集多少条，收集够后立即停止解析。
+    :return: ([[标题, 全记录链接], ...], 命中总数或None)
+    '''
+    with Metrics.get_instance().timer('parse_list'):
+        titlelist, total = parse_search_page(html, limit)
+    log.info(f"检索命中 {total if total is not None else '未知'} 条，解析得到 {len(titlelist)} 条")
+    return titlelist, total
 
 def canonical(isbnlike):
     """标准化ISBN，保留数字和X。"""
@@ -226,38 +582,298 @@ def to_isbn13(isbn10):
     check = check_digit13(isbn13)  # 计算校验码
     return isbn13 + check if check else ''  # 返回完整的ISBN-13
 
-def isbn2meta(isbn, log):
+def to_isbn10(isbn13):
+    """将978开头的ISBN-13转换为ISBN-10"""
+    isbn13 = canonical(isbn13)
+    if len(isbn13) == 10 and is_isbn10(isbn13):  # 如果已经是ISBN-10，直接返回
+        return isbn13
+    if not is_isbn13(isbn13) or not isbn13.startswith('978'):  # 979开头的ISBN-13没有对应的ISBN-10
+        return ''
+    isbn10 = isbn13[3:-1]  # 去掉"978"前缀和ISBN-13的校验位
+    check = check_digit10(isbn10)  # 计算校验码
+    return isbn10 + check if check else ''
+
+def validate_isbn(isbn, log):
     '''
-    将ISBN转换为元数据。
+    校验并标准化ISBN参数，允许连字符、空格及末位的X，无效时抛出异常。
     :param isbn: ISBN号码，作为字符串。
     :param log: 日志记录器。
-    :return: 解析后的元数据或None（获取失败时）。
+    :return: 标准化后的ISBN（10位或13位）。
     '''
     if not isinstance(isbn, str):
         log.info("ISBN必须是字符串")
         raise TypeError("ISBN必须是字符串")
 
-    try:
-        isbn_match = re.match(r"\d{10,}", isbn).group()
-    except AttributeError:
+    normalized = canonical(isbn)
+    if not normalized:
         log.info(f"无效的ISBN代码: {isbn}")
         raise ValueError(f"无效的ISBN代码: {isbn}")
+    return normalized
 
-    if isbn_match != isbn:
-        log.info(f"无效的ISBN代码: {isbn}")
-        raise ValueError(f"无效的ISBN代码: {isbn}")
+def isbn_variants(isbn):
+    '''
+    计算需要检索的ISBN形式：输入的形式在前，可换算时再加上另一种形式。
+    :param isbn: 标准化后的ISBN。
+    :return: ISBN列表。
+    '''
+    other = to_isbn10(isbn) if len(isbn) == 13 else to_isbn13(isbn)
+    return [isbn, other] if other and other != isbn else [isbn]
 
-    dynamic_url = get_dynamic_url(log)
-    if not dynamic_url:
+def search_isbn(isbn, log, cache_key=None, max_hits=MAX_ISBN_HITS):
+    '''
+    按一种ISBN形式检索。
+    :param isbn: 标准化后的ISBN。
+    :param log: 日志记录器。
+    :param cache_key: 存档索引使用的ISBN。
+    :param max_hits: 多条命中时最多保留多少条全记录链接。
+    :return: parse_isbn_search 的解析结果。
+    '''
+    with Metrics.get_instance().timer('search'):
+        response_text = OPACSession.get_instance().fetch(SEARCH_QUERY_TEMPLATE.format(isbn=isbn), log, isbn=cache_key)
+    return parse_isbn_search(response_text, isbn, log, max_hits)
+
+def parse_isbn_search(html, isbn, log, max_hits=MAX_ISBN_HITS):
+    '''
+    解析ISBN检索的结果页面。只有一条命中时OPAC直接返回全记录，多条命中时返回简要列表。
+    :param html: 检索结果页面HTML。
+    :param isbn: 检索的ISBN。
+    :param log: 日志记录器。
+    :param max_hits: 多条命中时最多保留多少条全记录链接。
+    :return: (NLCRecord 对象或None, 简要列表中的全记录链接列表)，未找到时为 (None, [])。
+    '''
+    record = parse_record(html, isbn, log)
+    if record is not None:
+        return record, []
+    titlelist, total = parse_search_list(html, log, max_hits)
+    if titlelist:
+        log.info(f"ISBN {isbn} 对应 {total or len(titlelist)} 条记录，下载其中 {len(titlelist)} 条全记录")
+    return None, [url for _, url in titlelist]
+
+def is_found(hit):
+    '''
+    :param hit: parse_isbn_search 的解析结果。
+    :return: 是否找到了全记录或简要列表。
+    '''
+    record, links = hit
+    return record is not None or bool(links)
+
+def pick_first_hit(outcomes):
+    '''
+    从多个检索结果中选出命中的结果。
+    :param outcomes: 按完成顺序排列的 (parse_isbn_search 的解析结果或None, 异常或None)。
+    :return: 第一个命中的结果；都未命中时，若有检索出错则抛出该异常，否则返回 (None, [])。
+    '''
+    errors = [error for _, error in outcomes if error is not None]
+    for hit, _ in outcomes:
+        if hit is not None and is_found(hit):
+            return hit
+    if errors:
+        raise errors[0]
+    return None, []
+
+def search_isbn_forms(forms, log, cache_key, max_hits=MAX_ISBN_HITS, max_workers=MAX_WORKERS):
+    '''
+    同时检索ISBN-10与ISBN-13两种形式，采用最先命中的结果，并取消尚未开始的另一检索。
+    :param forms: ISBN形式列表。
+    :param log: 日志记录器。
+    :param cache_key: 存档索引使用的ISBN。
+    :param max_hits: 多条命中时最多保留多少条全记录链接。
+    :param max_workers: 全局线程池大小，批量识别时应与批量的线程数一致。
+    :return: parse_isbn_search 的解析结果。
+    '''
+    pool = WorkerPool.get_instance()
+    pool.resize(max_workers)
+    pending = {pool.submit(search_isbn, form, log, cache_key, max_hits): form for form in forms}
+    outcomes = []
+    try:
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                form = pending.pop(future)
+                try:
+                    hit = future.result()
+                except Exception as e:
+                    log.info(f"按 {form} 检索失败: {e}")
+                    outcomes.append((None, e))
+                    continue
+                outcomes.append((hit, None))
+                if is_found(hit):
+                    if form != forms[0]:
+                        log.info(f"按 {forms[0]} 未找到，按 {form} 找到记录")
+                    return hit
+    finally:
+        for future in pending:
+            future.cancel()
+    return pick_first_hit(outcomes)
+
+def record_url(url, record_format=RECORD_FORMAT):
+    '''
+    将全记录链接改写为指定的显示格式。
+    :param url: 简要列表中的全记录链接。
+    :param record_format: Aleph的显示格式代码。
+    :return: 改写后的链接，链接中没有格式参数时追加。
+    '''
+    if RECORD_FORMAT_PATTERN.search(url):
+        return RECORD_FORMAT_PATTERN.sub(lambda match: match.group(1) + record_format, url, count=1)
+    return url + ('&' if '?' in url else '?') + f'format={record_format}'
+
+def url2record(url, isbn, log, abort=None, search=None):
+    '''
+    下载并解析一条全记录。
+    :param url: 全记录链接。
+    :param isbn: 检索的ISBN。
+    :param log: 日志记录器。
+    :param abort: 可选的 threading.Event，置位后不再下载。
+    :param search: 得到该链接的检索条件（ISBN或标题），用于存档索引。
+    :return: NLCRecord 对象或None（已取消或获取失败时）。
+    '''
+    if abort is not None and abort.is_set():
+        return None
+    try:
+        record = parse_record(fetch_html(record_url(url), log=log, search=search), isbn, log)
+        if record is None and RECORD_FORMAT != TABLE_RECORD_FORMAT:
+            log_record_fallback(url, log)
+            record = parse_record(fetch_html(record_url(url, TABLE_RECORD_FORMAT), log=log, search=search), isbn, log)
+        return record
+    except Exception as e:
+        log.error(f"获取全记录失败 {url}: {e}")
         return None
 
-    search_url = SEARCH_URL_TEMPLATE.format(isbn=isbn)
-    
-    response = urllib.request.urlopen(urllib.request.Request(search_url, headers=HEADERS), timeout=10)
-    response_text = response.read().decode('utf-8')
-    parse_metadata = get_parse_metadata(response_text, isbn, log)
-    metadata = to_metadata(parse_metadata, False, log)
-    return metadata
+def log_record_fallback(url, log):
+    '''
+    记录MARC格式全记录解析失败、改用标准格式重新下载。
+    :param url: 全记录链接。
+    :param log: 日志记录器。
+    '''
+    Metrics.get_instance().add('marc_fallbacks')
+    log.info(f"MARC格式全记录解析失败，改用标准格式: {url}")
+
+def fetch_isbn_records(links, isbn, log, on_record=None, max_workers=MAX_WORKERS, abort=None, timeout=None):
+    '''
+    并发下载同一ISBN对应的多条全记录，每得到一条记录就调用一次 on_record。
+    :param links: 全记录链接列表。
+    :param isbn: 检索的ISBN。
+    :param log: 日志记录器。
+    :param on_record: 可选的回调函数，参数为 NLCRecord 对象，在调用方线程中按完成顺序调用。
+    :param max_workers: 同时进行的下载数。
+    :param abort: 可选的 threading.Event，置位后停止下载尚未开始的全记录。
+    :param timeout: 超时时间（单位：秒），超时后放弃尚未完成的全记录。
+    :return: NLCRecord 列表，顺序与 links 一致，不含获取失败或被放弃的条目。
+    '''
+    deadline = time.monotonic() + timeout if timeout else None
+    pool = WorkerPool.get_instance()
+    pool.resize(max_workers)
+    results = iter_completed(lambda job: pool.submit(url2record, job[1], isbn, log, abort, isbn),
+                             list(enumerate(links)), max_workers, log, deadline)
+    records = {}
+    with closing(results):
+        for (index, _), record in results:
+            if record is not None:
+                records[index] = record
+                if on_record is not None:
+                    on_record(record)
+            if abort is not None and abort.is_set():
+                log.info("检索已取消")
+                break
+    return [records[index] for index in sorted(records)]
+
+def records_to_cache(records):
+    '''
+    :param records: NLCRecord 列表。
+    :return: 写入缓存的数据：未找到时为None，一条记录时与旧格式相同，多条记录时为列表。
+    '''
+    if not records:
+        return None
+    if len(records) == 1:
+        return records[0].to_json()
+    return [record.to_json() for record in records]
+
+def isbn2records(isbn, log, cache=None, dual_lookup=DUAL_ISBN_LOOKUP, on_record=None, max_workers=MAX_WORKERS,
+                 max_hits=MAX_ISBN_HITS, abort=None, timeout=None):
+    '''
+    根据ISBN获取原始记录。一个ISBN对应多条记录（如不同版本、分册）时，并发下载全部全记录。
+    :param isbn: ISBN号码，作为字符串，可含连字符。
+    :param log: 日志记录器。
+    :param cache: 可选的 MetadataCache，命中时不再访问网络。
+    :param dual_lookup: 是否同时按ISBN-10与ISBN-13两种形式检索。
+    :param on_record: 可选的回调函数，每得到一条记录调用一次。
+    :param max_workers: 全局线程池大小，即双形式检索与多条命中时同时进行的下载数。
+    :param max_hits: 多条命中时最多下载多少条全记录。
+    :param abort: 可选的 threading.Event，置位后停止下载尚未开始的全记录。
+    :param timeout: 多条命中时下载全记录的超时时间（单位：秒）。
+    :return: NLCRecord 列表，未找到时为空列表。
+    '''
+    isbn = validate_isbn(isbn, log)
+
+    cache_key = to_isbn13(isbn) or isbn
+    hit, records = get_cached_records(cache, cache_key, log)
+    if hit:
+        if on_record is not None:
+            for record in records:
+                on_record(record)
+        return records
+
+    forms = isbn_variants(isbn) if dual_lookup else [isbn]
+    if len(forms) == 1:
+        record, links = search_isbn(isbn, log, cache_key, max_hits)
+    else:
+        record, links = search_isbn_forms(forms, log, cache_key, max_hits, max_workers)
+    if record is not None:
+        records = [record]
+        if on_record is not None:
+            on_record(record)
+    elif links:
+        records = fetch_isbn_records(links, isbn, log, on_record, max_workers, abort, timeout)
+    else:
+        records = []
+    # 部分全记录获取失败时不写入缓存，下次重新检索
+    if cache is not None and cache_key and (record is not None or len(records) == len(links)):
+        cache.put(cache_key, records_to_cache(records))
+    return records
+
+def isbn2parse(isbn, log, cache=None, dual_lookup=DUAL_ISBN_LOOKUP, max_workers=MAX_WORKERS):
+    '''
+    根据ISBN获取解析后的元数据字典。
+    :param isbn: ISBN号码，作为字符串，可含连字符。
+    :param log: 日志记录器。
+    :param cache: 可选的 MetadataCache，命中时不再访问网络。
+    :param dual_lookup: 是否同时按ISBN-10与ISBN-13两种形式检索。
+    :param max_workers: 全局线程池大小。
+    :return: get_parse_metadata 的解析结果或None（未找到时）。对应多条记录时为第一条。
+    '''
+    records = isbn2records(isbn, log, cache, dual_lookup, max_workers=max_workers)
+    return record_to_dict(records[0] if records else None)
+
+def isbn2meta(isbn, log, cache=None, dual_lookup=DUAL_ISBN_LOOKUP):
+    '''
+    将ISBN转换为元数据。
+    :param isbn: ISBN号码，作为字符串，可含连字符。
+    :param log: 日志记录器。
+    :param cache: 可选的 MetadataCache，命中时不再访问网络。
+    :param dual_lookup: 是否同时按ISBN-10与ISBN-13两种形式检索。
+    :return: 解析后的元数据或None（获取失败时）。对应多条记录时为第一条。
+    '''
+    return to_metadata(isbn2parse(isbn, log, cache, dual_lookup), False, log)
+
+def isbn2metadata(isbn, log, result_queue, clean_downloaded_metadata, cache=None, dual_lookup=DUAL_ISBN_LOOKUP,
+                  max_workers=MAX_WORKERS, max_hits=MAX_ISBN_HITS, abort=None, timeout=None):
+    '''
+    根据ISBN获取元数据，每得到一条结果就放入 result_queue。
+    ISBN对应多条记录时，各条记录分别放入队列，以 nlchash 标识区分。
+    :param isbn: ISBN号码，作为字符串，可含连字符。
+    :param log: 日志记录器。
+    :param result_queue: 结果队列。
+    :param clean_downloaded_metadata: 清理元数据的函数。
+    :return: 元数据对象列表。其余参数同 isbn2records。
+    '''
+    metadatas = []
+
+    def put(record):
+        metadatas.append(deliver_record(record, log, result_queue, clean_downloaded_metadata))
+
+    isbn2records(isbn, log, cache, dual_lookup, on_record=put, max_workers=max_workers, max_hits=max_hits,
+                 abort=abort, timeout=timeout)
+    return metadatas
 
 def parse_isbn(html, log):
     '''
@@ -268,22 +884,29 @@ def parse_isbn(html, log):
     :return: 解析出的ISBN号，如果未找到则为空字符串。
     '''
 
-    # 定义匹配ISBN的正则表达式模式
-    isbn_pattern = r'ISBN: ([\d\-]+)'
-    
     # 在HTML文本中搜索ISBN号的匹配项
-    isbn_matches = re.search(isbn_pattern, html)
+    isbn_matches = ISBN_PATTERN.search(html)
 
     # 如果找到匹配项，则将ISBN保存到isbn变量中，否则记录未找到的信息
     if isbn_matches:
         isbn = isbn_matches.group(1)
         isbn = isbn.replace('-','')
-        if is_isbn10(isbn):
-            isbn = to_isbn13(isbn)
     else:
         log.info(f'未找到ISBN号')
         isbn = ''
-    
+
+    return normalize_parsed_isbn(isbn, log)
+
+def normalize_parsed_isbn(isbn, log):
+    '''
+    将记录中的ISBN-10转换为ISBN-13。
+    :param isbn: 记录中的ISBN，不含连字符。
+    :param log: 日志记录器。
+    :return: 转换后的ISBN。
+    '''
+    if is_isbn10(isbn):
+        isbn = to_isbn13(isbn)
+
     # 记录找到的或未找到的ISBN号，并返回结果
 
     log.info(f'解析得到的ISBN号: {isbn}')
@@ -291,126 +914,81 @@ def parse_isbn(html, log):
     return isbn
 
 
-def get_parse_metadata(html, isbn, log):
+def parse_record(html, isbn, log):
     '''
-    从BeautifulSoup对象中解析元数据。
+    从全记录页面中解析出原始记录。MARC格式的页面按字段号解析，标准格式的页面按中文标签解析。
     :param html: html。
     :param isbn: ISBN号码，作为字符串。
     :param log: 日志记录器。
-    :return: 解析后的元数据或None（解析失败时）。
+    :return: NLCRecord 对象或None（解析失败时）。
     '''
-    web_isbn = parse_isbn(html, log)
-    soup = BeautifulSoup(html, "html.parser")
-    
-    data = {}
-    prev_td1 = ''
-    prev_td2 = ''
-    data.update({'isbn': isbn})
-    data.update({web_isbn: web_isbn})
-    
-    try:
-        table = soup.find("table", attrs={"id": "td"})
-        if not table:
-            return
-    except Exception:
-        return
+    metrics = Metrics.get_instance()
+    with metrics.timer('parse'):
+        rows = parse_record_table(html)
+        if rows is None:
+            return None
+        marc_fields = parse_marc_rows(rows)
+        if marc_fields is not None:
+            record = MARCRecord(marc_fields, isbn)
+            if not record.is_valid():
+                # 缺少正题名，由调用方改用标准格式
+                log.info("MARC格式全记录中没有题名字段（200$a）")
+                return None
+            record.isbn = normalize_parsed_isbn(record.marc_isbn, log)
+            metrics.add('marc_records')
+        else:
+            record = NLCRecord.from_rows(rows, isbn, parse_isbn(html, log))
+        metrics.add('records')
+    index_record(record, log)
+    return record
 
-    tr_elements = table.find_all('tr')
+def record_to_dict(record):
+    '''
+    按当前选项从原始记录派生元数据字典。
+    :param record: NLCRecord 对象或None。
+    :return: 元数据字典或None。
+    '''
+    if record is None:
+        return None
+    with Metrics.get_instance().timer('derive'):
+        return record.to_dict(strip_title=IS_STRIP_TITLE, strip_author=IS_STRIP_AUTHOR, purse_tag=IS_PURSETAG,
+                              add_clc=ADD_CLC_TO_TAGS, convert_clc=CONVERT_CLC_TO_TAG, clc_level=CLC_PARSE_LEVEL)
 
-    for tr in tr_elements:
-        td_elements = tr.find_all('td', class_='td1')
-        if len(td_elements) == 2:
-            td1 = td_elements[0].get_text(strip=True).replace('\n', '').replace('\xa0', ' ')
-            td2 = td_elements[1].get_text(strip=True).replace('\n', '').replace('\xa0', ' ')
-            if td1 == '' and td2 == '':
-                continue
-            if td1:
-                data.update({td1: td2.strip()})
-            else:
-                data.update({prev_td1: '\n'.join([prev_td2, td2]).strip()})
-            prev_td1 = td1.strip()
-            prev_td2 = td2.strip()
-            
-    # 优化标题格式
-    title = data.get("题名与责任", f"{isbn}")
-    if IS_STRIP_TITLE:
-        pattern = r"([\u4e00-\u9fa5a-zA-Z0-9]+(?:[\u4e00-\u9fa5a-zA-Z0-9\s]+)?)(?=\s\[[\u4e00-\u9fa5]{2}\])" #
-        try:
-            match = re.search(pattern, title)
-            if match:
-                title = match.group(1)
-        except re.error as e:
-            log.error(f"正则表达式匹配错误: {e}, title: {title}")
-
-    authors = data.get("著者", "").split(' & ')
-    if IS_STRIP_AUTHOR:
-        author_pattern = re.compile(r'^(.*?)\s+(?:著|编)')
-        try:
-            stripped_authors = []
-            for author_entry in authors:
-                match = author_pattern.match(author_entry)
-                if match:
-                    author_name = match.group(1)
-                    stripped_authors.append(author_name)
-            authors = stripped_authors
-        except re.error as e:
-            log.error(f"正则表达式匹配错误: {e}, authors: {authors}")
-
-    # 使用正则表达式匹配日期
-    year, month, day = '', '', ''
-    # 从"通用数据"第10-13位提取出版年份
-    pubdate_match = re.search(r'\d{9}(\d{4})', data.get("通用数据", ""))
-    if pubdate_match:
-        year = pubdate_match.group(1)
-        pubdate = year  # 仅使用年份
-    else:
-        # 如果无法从"通用数据"提取，则从"出版项"提取年份
-        pubdate_match = re.search(r'\b(\d{4})\b', data.get("出版项", ""))
-        if pubdate_match:
-            year = pubdate_match.group(1)
-            pubdate = year  # 仅使用年份
-        else:
-            pubdate = ""
+def get_parse_metadata(html, isbn, log):
+    '''
+    从全记录页面中解析元数据。
+    :param html: html。
+    :param isbn: ISBN号码，作为字符串。
+    :param log: 日志记录器。
+    :return: 解析后的元数据或None（解析失败时）。
+    '''
+    return record_to_dict(parse_record(html, isbn, log))
 
-    publisher_match = re.search(r':\s*(.+),\s', data.get("出版项", ""))
-    publisher = publisher_match.group(1) if publisher_match else ""
-    
-    tags = data.get("主题", "").replace('--', '&')
-    if not IS_PURSETAG:
-        tags += f' & {publisher}'
-        if year:
-            tags += f' & {year}'
-        # 处理中图分类号相关选项
-        clc_code = data.get("中图分类号", "")
-        if ADD_CLC_TO_TAGS:
-            if CONVERT_CLC_TO_TAG:
-                # 使用 Parser 解析中图分类号
-                parse_level = CLC_PARSE_LEVEL
-                parsed_clc = Parser.parse(clc_code)
-                if parsed_clc:
-                        clc_codes = list(parsed_clc.values())[0]
-                        if len(clc_codes) >= parse_level:
-                            clc_info = Parser.get_clc_info_by_code(clc_codes[parse_level - 1])
-                            if clc_info:
-                                tags += f' & {clc_info["namePath"][parse_level - 1]}'
-                        elif 0 < len(clc_codes) < parse_level:
-                            tags += f' & {clc_codes[-1]}'
-                else:
-                    tags += f' & {clc_code}'
-            else:
-                tags += f' & {clc_code}'
-    tags = [tag.strip() for tag in re.split(r'[&\s]+', tags) if tag.strip()]
-    
-    metadata = {
-        "title": title,
-        "tags": tags,
-        "comments": data.get("内容提要", ""),
-        'publisher': publisher,
-        'pubdate': pubdate,
-        'authors': authors,
-        "isbn": data.get(f"{web_isbn}", f"{isbn}")
-    }
-    return metadata
+def get_cached_records(cache, cache_key, log):
+    '''
+    从缓存中读取原始记录。
+    :param cache: MetadataCache 对象或None。
+    :param cache_key: 缓存键。
+    :return: (是否命中, NLCRecord 列表)。旧格式的缓存条目视为未命中。
+    '''
+    if cache is None or not cache_key:
+        return False, []
+    hit, data = cache.get(cache_key)
+    if not hit:
+        Metrics.get_instance().add('cache_misses')
+        return False, []
+    Metrics.get_instance().add('cache_hits')
+    if data is None:
+        log.info(f"命中缓存: {cache_key}（未收录）")
+        return True, []
+    records = [NLCRecord.from_json(item) for item in (data if isinstance(data, list) else [data])]
+    if not records or None in records:
+        return False, []
+    log.info(f"命中缓存: {cache_key}" + (f"（{len(records)} 条记录）" if len(records) > 1 else ""))
+    # 启用索引前缓存的记录也补充写入索引
+    for record in records:
+        index_record(record, log)
+    return True, records
 
 def to_metadata(book, add_translator_to_author, log):
     '''
@@ -439,9 +1017,9 @@ def to_metadata(book, add_translator_to_author, log):
         pubdate = book.get('pubdate', None)
         if pubdate:
             try:
-                if re.compile('^\\d{4}-\\d+$').match(pubdate):
+                if PUBDATE_MONTH_PATTERN.match(pubdate):
                     mi.pubdate = datetime.strptime(pubdate, '%Y-%m')
-                elif re.compile('^\\d{4}-\\d+-\\d+$').match(pubdate):
+                elif PUBDATE_DAY_PATTERN.match(pubdate):
                     mi.pubdate = datetime.strptime(pubdate, '%Y-%m-%d')
             except:
                 log.error('解析出版日期失败 %r' % pubdate)
@@ -477,12 +1055,17 @@ class NLCISBNPlugin(Source):
         Option(
             'max_title_list_num', 'number', MAX_TITLE_LIST_NUM,
             _('最大返回量'),
-            _('通过标题搜索时，最多返回多少数据。请求量过多可能因为请求过于频繁被封锁IP。')
+            _('通过标题搜索时，最多返回多少数据（按与标题、作者的相关度从高到低选取）。请求量过多可能因为请求过于频繁被封锁IP。')
+        ),
+        Option(
+            'request_rate', 'number', REQUEST_RATE,
+            _('初始请求速率'),
+            _('所有线程合计每秒最多向国家图书馆发出多少次请求（单位：次/秒）。请求出错时速率会自动降低。')
         ),
         Option(
-            'spider_base_sleep_time', 'number', SPIDER_BASE_SLEEP_TIME,
-            _('爬虫基础间隔时间'),
-            _('爬虫两次爬取的间隔时间（单位：ms毫秒）。爬虫间隔时间 = 爬虫基础间隔时间 + 30 ~ 600 ms 的随机间隔时间')
+            'max_request_rate', 'number', MAX_REQUEST_RATE,
+            _('最大请求速率'),
+            _('请求持续成功时，速率会逐步提高，但不超过该值（单位：次/秒）。过大可能导致用户IP被封锁。')
         ),
         Option(
             'is_strip_title', 'bool', IS_STRIP_TITLE,
@@ -523,6 +1106,81 @@ class NLCISBNPlugin(Source):
             'clc_parse_level', 'number', CLC_PARSE_LEVEL,
             _('中图分类号解析层级'),
             _('解析中图分类号的层级深度，取值范围1-3。1表示仅解析一级分类，3表示解析完整分类。默认为2。')
+        ),
+        Option(
+            'dual_isbn_lookup', 'bool', DUAL_ISBN_LOOKUP,
+            _('同时检索ISBN-10与ISBN-13'),
+            _('国家图书馆的记录有时只以另一种形式的ISBN编目。启用后同时检索两种形式，采用先得到的结果。默认为“是”。')
+        ),
+        Option(
+            'max_isbn_hits', 'number', MAX_ISBN_HITS,
+            _('同一ISBN最多返回的记录数'),
+            _('一个ISBN对应多条记录（如不同版本、分册）时，最多下载多少条全记录，各条记录以nlchash区分。默认为10。')
+        ),
+        Option(
+            'max_retries', 'number', MAX_RETRIES,
+            _('失败重试次数'),
+            _('请求超时、连接失败或服务器繁忙时最多重试几次，重试间隔按指数增长并加入随机抖动。默认为2次。')
+        ),
+        Option(
+            'circuit_failure_threshold', 'number', CIRCUIT_FAILURE_THRESHOLD,
+            _('熔断阈值'),
+            _('连续失败多少次后暂停访问国家图书馆，暂停期间的查询立即失败而不再等待超时。设为0则不熔断。默认为5次。')
+        ),
+        Option(
+            'circuit_cooldown', 'number', CIRCUIT_COOLDOWN,
+            _('熔断冷却时间（秒）'),
+            _('熔断后暂停访问多少秒，之后先发送一个试探请求，成功后恢复正常。默认为60秒。')
+        ),
+        Option(
+            'enable_cache', 'bool', ENABLE_CACHE,
+            _('是否启用本地缓存'),
+            _('是否将ISBN查询结果缓存到本地。命中缓存时不再访问国家图书馆，也不再等待爬虫间隔时间。默认为“是”。')
+        ),
+        Option(
+            'cache_ttl_days', 'number', CACHE_TTL_DAYS,
+            _('缓存有效期（天）'),
+            _('缓存的查询结果在多少天后失效，失效后将重新从国家图书馆获取。默认为30天。')
+        ),
+        Option(
+            'cache_max_entries', 'number', CACHE_MAX_ENTRIES,
+            _('缓存最大条数'),
+            _('本地缓存最多保存多少条记录，超出后淘汰最久未使用的记录。默认为50000条。')
+        ),
+        Option(
+            'cache_negative_ttl_hours', 'number', CACHE_NEGATIVE_TTL_HOURS,
+            _('未找到结果的缓存时间（小时）'),
+            _('国家图书馆未收录的ISBN，在多少小时内不再重复查询。设为0则不缓存未找到的结果。默认为24小时。')
+        ),
+        Option(
+            'enable_local_index', 'bool', ENABLE_LOCAL_INDEX,
+            _('是否启用本地题名索引'),
+            _('将下载过的全记录的题名、作者、出版社、ISBN和中图分类号写入本地全文索引。'
+              '通过标题搜索时先查询本地索引，有与标题几乎一致的记录时直接返回，不再访问国家图书馆。'
+              '有效期与容量上限同本地缓存。默认为“是”。')
+        ),
+        Option(
+            'use_async_engine', 'bool', USE_ASYNC_ENGINE,
+            _('使用异步查询引擎（实验功能）'),
+            _('是否使用基于asyncio的查询引擎。所有请求在同一个线程中并发进行，占用资源更少。默认为“否”。')
+        ),
+        Option(
+            'early_stop_matches', 'number', EARLY_STOP_MATCHES,
+            _('提前结束所需的吻合结果数'),
+            _('通过标题搜索时，得到多少条与标题完全吻合的结果后，不再下载其余结果。设为0则总是下载全部结果。默认为2。')
+        ),
+        Option(
+            'archive_mode', 'choices', ARCHIVE_MODE,
+            _('原始页面存档'),
+            _('“录制”将下载的检索页面和全记录页面压缩保存到本地存档；“回放”只从存档读取页面、不访问网络，'
+              '用于修改选项后离线重新解析已下载的书籍。默认为“关闭”。'),
+            choices={'off': _('关闭'), 'record': _('录制'), 'replay': _('回放')}
+        ),
+        Option(
+            'metrics_export_path', 'string', METRICS_EXPORT_PATH,
+            _('查询统计导出文件'),
+            _('每次识别结束后，将各阶段耗时与请求数、缓存命中等统计导出到该文件。'
+              '扩展名为 .prom 或 .txt 时使用Prometheus文本格式，否则为JSON。留空则只写入日志。')
         )
     )
     
@@ -532,34 +1190,132 @@ class NLCISBNPlugin(Source):
     def get_book_url(self, identifiers):
         return None
 
+    def get_cache(self):
+        '''
+        根据用户设置获取本地缓存。
+        :return: MetadataCache 对象，未启用缓存时为None。
+        '''
+        if not self.prefs.get('enable_cache'):
+            return None
+        cache = MetadataCache.get_instance(CACHE_PATH)
+        cache.configure(
+            ttl=self.prefs.get('cache_ttl_days') * 86400,
+            max_entries=self.prefs.get('cache_max_entries'),
+            negative_ttl=self.prefs.get('cache_negative_ttl_hours') * 3600
+        )
+        return cache
+
+    def get_index(self, log):
+        '''
+        根据用户设置启用本地索引。
+        :param log: 日志记录器。
+        :return: RecordIndex 对象，未启用或当前SQLite不支持FTS5时为None。
+        '''
+        if not self.prefs.get('enable_local_index'):
+            RecordIndex.deactivate()
+            return None
+        try:
+            index = RecordIndex.activate(INDEX_PATH)
+        except sqlite3.Error as e:
+            log.error(f"无法打开本地索引 {INDEX_PATH}: {e}")
+            RecordIndex.deactivate()
+            return None
+        index.configure(
+            ttl=self.prefs.get('cache_ttl_days') * 86400,
+            max_entries=self.prefs.get('cache_max_entries')
+        )
+        return index
+
     def identify(self, log, result_queue, abort, title=None, authors=None, identifiers={}, timeout=60):
         isbn = identifiers.get('isbn', '')
+        HTTPTransport.get_instance(HEADERS).resize(self.prefs.get('max_workers'))
+        RateLimiter.get_instance().configure(
+            rate=self.prefs.get('request_rate'),
+            max_rate=self.prefs.get('max_request_rate')
+        )
+        RetryPolicy.get_instance().configure(max_retries=self.prefs.get('max_retries'))
+        CircuitBreaker.get_instance().configure(
+            failure_threshold=self.prefs.get('circuit_failure_threshold'),
+            cooldown=self.prefs.get('circuit_cooldown')
+        )
         
-        # 根据isbn获取metadata
-        metadata = None
-        if isbn:
-          metadata = isbn2meta(isbn, log)
-
-          log.info(f"正在根据isbn获取metadata...")
-          if metadata:
-              result_queue.put(metadata)
+        archive_mode = self.prefs.get('archive_mode')
+        if archive_mode in ('record', 'replay'):
+            ResponseArchive.activate(ARCHIVE_PATH, replay=archive_mode == 'replay')
         else:
-            log.info(f"未检测到isbn。")
-            # 根据书名获取metadata
-            metadata = None
-            if title:
-                log.info(f"正在根据书名获取metadata...")
-                if IS_FUZZY_SEARCH_WITH_AUTHOR and authors and isinstance(authors, list):
-                    title += authors[0]
+            ResponseArchive.deactivate()
+        # 回放时总是重新解析存档中的页面，不读取缓存和本地索引
+        if archive_mode == 'replay':
+            cache = None
+            RecordIndex.deactivate()
+        else:
+            cache = self.get_cache()
+            self.get_index(log)
+
+        if self.prefs.get('use_async_engine'):
+            from .async_engine import isbn2metadata as lookup_isbn, title2metadata as lookup_title
+        else:
+            lookup_isbn, lookup_title = isbn2metadata, title2metadata
 
-                metadatas = title2metadata(title, log, result_queue, self.clean_downloaded_metadata,
+        try:
+            # 根据isbn获取metadata
+            metadata = None
+            if isbn:
+              log.info(f"正在根据isbn获取metadata...")
+              lookup_isbn(isbn, log, result_queue, self.clean_downloaded_metadata,
+                          cache = cache,
+                          dual_lookup = self.prefs.get('dual_isbn_lookup'),
+                          max_workers = self.prefs.get('max_workers'),
+                          max_hits = self.prefs.get('max_isbn_hits'),
+                          abort = abort,
+                          timeout = timeout
+                          )
+            else:
+                log.info(f"未检测到isbn。")
+                # 根据书名获取metadata
+                metadata = None
+                if title:
+                    log.info(f"正在根据书名获取metadata...")
+                    metadatas = title2local(title, log, result_queue, self.clean_downloaded_metadata,
                                             max_title_list_num = self.prefs.get('max_title_list_num'),
-                                            max_workers = self.prefs.get('max_workers')
+                                            authors = authors
                                             )
-            else:
-                log.info(f'未检测到title。')
+                    if not metadatas:
+                        metadatas = lookup_title(title, log, result_queue, self.clean_downloaded_metadata,
+                                                    max_title_list_num = self.prefs.get('max_title_list_num'),
+                                                    max_workers = self.prefs.get('max_workers'),
+                                                    authors = authors,
+                                                    abort = abort,
+                                                    timeout = timeout,
+                                                    early_stop_matches = self.prefs.get('early_stop_matches')
+                                                    )
+                else:
+                    log.info(f'未检测到title。')
+        finally:
+            self.report_metrics(log)
 
             
+    def report_metrics(self, log):
+        '''
+        将累计的查询统计写入日志，并按设置导出到文件。
+        :param log: 日志记录器。
+        '''
+        metrics = Metrics.get_instance()
+        cache_info = Parser.resolve_cache_info()
+        metrics.set('clc_cache_hits', cache_info.hits)
+        metrics.set('clc_cache_misses', cache_info.misses)
+        counters = metrics.snapshot()['counters']
+        if counters.get('records'):
+            # 平均每条记录的传输字节数，含会话、检索与简要列表页面
+            metrics.set('bytes_per_record', round(counters.get('bytes', 0) / counters['records']))
+        log.info(metrics.summary())
+        export_path = self.prefs.get('metrics_export_path')
+        if export_path:
+            try:
+                metrics.export(export_path)
+            except OSError as e:
+                log.error(f"导出查询统计失败 {export_path}: {e}")
+
     def download_cover(self, log, result_queue, abort, title=None, authors=None, identifiers={}, timeout=30, get_best_cover=False):
         return
 
@@ -0,0 +1,162 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+import urllib.parse
+import zlib
+
+# 动态URL中的会话号，如 http://opac.nlc.cn:80/F/<会话号>?func=...
+SESSION_PATH_PATTERN = re.compile(r'/F/[^?#]*')
+# 压缩级别
+COMPRESS_LEVEL = 6
+
+
+def archive_key(url, search=None):
+    '''
+    计算页面在存档中的键。只保留路径与查询字符串，并去掉路径中的会话号，
+    使不同会话下的同一检索对应同一条存档：录制时请求的是 http://opac.nlc.cn:80/F/<会话号>?...，
+    回放时请求的是 http://opac.nlc.cn/F?...，两者的键相同。
+
+    全记录链接（func=full-set-set）中的 set_number 同样属于会话，给出 search 时以检索条件代替，
+    只保留 set_entry 与 format。
+    :param url: 页面URL。
+    :param search: 全记录所属的检索条件（ISBN或标题）。
+    :return: 存档键。
+    '''
+    parts = urllib.parse.urlsplit(url)
+    path = SESSION_PATH_PATTERN.sub('/F', parts.path, count=1)
+    query = urllib.parse.parse_qs(parts.query)
+    if search and query.get('func') == ['full-set-set']:
+        return f'{path}?' + urllib.parse.urlencode({
+            'func': 'full-set-set',
+            'search': search,
+            'set_entry': query.get('set_entry', [''])[0],
+            'format': query.get('format', [''])[0],
+        })
+    return f'{path}?{parts.query}' if parts.query else path
+
+
+class ResponseArchive:
+    '''
+    OPAC原始响应存档。
+
+    将检索页面和全记录页面的原始HTML以zlib压缩后存入单个SQLite文件，按URL（去掉会话号）和ISBN建立索引。
+    录制模式下每次成功下载的页面都会写入存档；回放模式下所有页面都从存档读取，不访问网络，
+    用于在调整选项或解析规则后离线重新解析已下载的记录。
+    '''
+
+    # 单例模式，按数据库路径区分
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    # 当前启用的存档及是否处于回放模式
+    _active = None
+    _replay = False
+
+    def __init__(self, path):
+        '''
+        :param path: SQLite数据库文件路径。
+        '''
+        self.path = path
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            'key TEXT PRIMARY KEY, '
+            'isbn TEXT, '
+            'body BLOB NOT NULL, '
+            'fetched REAL NOT NULL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS responses_isbn ON responses (isbn)')
+        self._conn.commit()
+
+    @classmethod
+    def get_instance(cls, path):
+        with cls._instances_lock:
+            instance = cls._instances.get(path)
+            if instance is None:
+                instance = cls._instances[path] = cls(path)
+            return instance
+
+    @classmethod
+    def activate(cls, path, replay=False):
+        '''
+        启用存档。
+        :param path: 存档文件路径。
+        :param replay: 为True时进入回放模式，否则为录制模式。
+        '''
+        archive = cls.get_instance(path)
+        with cls._instances_lock:
+            cls._active = archive
+            cls._replay = replay
+        return archive
+
+    @classmethod
+    def deactivate(cls):
+        with cls._instances_lock:
+            cls._active = None
+            cls._replay = False
+
+    @classmethod
+    def active(cls):
+        '''
+        :return: (当前启用的存档或None, 是否处于回放模式)
+        '''
+        with cls._instances_lock:
+            return cls._active, cls._replay
+
+    def put(self, url, html, isbn=None, search=None):
+        '''
+        写入页面，已存在时覆盖。
+        :param url: 页面URL。
+        :param html: 页面HTML。
+        :param isbn: 页面对应的ISBN，仅ISBN检索时已知。
+        :param search: 全记录所属的检索条件，见 archive_key。
+        '''
+        body = zlib.compress(html.encode('utf-8'), COMPRESS_LEVEL)
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO responses (key, isbn, body, fetched) VALUES (?, ?, ?, ?)',
+                (archive_key(url, search), isbn, body, time.time())
+            )
+            self._conn.commit()
+
+    def get(self, url, isbn=None, search=None):
+        '''
+        读取页面。按URL找不到时，若给出了ISBN则按ISBN查找。
+        :param url: 页面URL。
+        :param isbn: 页面对应的ISBN。
+        :param search: 全记录所属的检索条件，见 archive_key。
+        :return: 页面HTML，不存在时为None。
+        '''
+        with self._lock:
+            row = self._conn.execute('SELECT body FROM responses WHERE key = ?', (archive_key(url, search),)).fetchone()
+            if row is None and isbn:
+                row = self._conn.execute(
+                    'SELECT body FROM responses WHERE isbn = ? ORDER BY fetched DESC LIMIT 1', (isbn,)
+                ).fetchone()
+        return zlib.decompress(row[0]).decode('utf-8') if row else None
+
+    def isbns(self):
+        '''
+        :return: 存档中所有ISBN检索对应的ISBN列表。
+        '''
+        with self._lock:
+            return [row[0] for row in self._conn.execute(
+                'SELECT DISTINCT isbn FROM responses WHERE isbn IS NOT NULL ORDER BY isbn')]
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute('DELETE FROM responses')
+            self._conn.commit()
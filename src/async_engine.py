@@ -0,0 +1,594 @@
+'''
+基于 asyncio 的查询引擎。
+
+所有请求在同一个后台事件循环线程中多路复用：会话URL、检索页面和全记录页面均以异步方式下载，
+并发数由 asyncio.Semaphore 控制，请求速率与同步路径共用全局限速器。
+页面解析、缓存与存档的SQLite读写以及元数据转换在线程池中执行，不阻塞事件循环上其他请求的网络I/O。
+isbn2meta / isbn2metadata / title2metadata 是与同步版本参数、返回值一致的同步包装，可直接在Calibre中调用。
+'''
+import asyncio
+import functools
+import http.client
+import http.cookiejar
+import io
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from . import (BASE_URL, HEADERS, MAX_WORKERS, MAX_TITLE_LIST_NUM, EARLY_STOP_MATCHES, IS_FUZZY_SEARCH_WITH_AUTHOR, DUAL_ISBN_LOOKUP,
+               MAX_ISBN_HITS, SEARCH_QUERY_TEMPLATE, SEARCH_QUERY_TEMPLATE_TITLE, RECORD_FORMAT, TABLE_RECORD_FORMAT,
+               SESSION_EXPIRED_PATTERN, BLOCK_PAGE_PATTERN,
+               extract_dynamic_url, validate_isbn, to_isbn13, isbn_variants, is_found, pick_first_hit, is_confident_match,
+               parse_search_list, parse_isbn_search, record_url, log_record_fallback, parse_record, record_to_dict, records_to_cache, get_cached_records,
+               deliver_record, to_metadata)
+from .archive import ResponseArchive
+from .metrics import Metrics
+from .ranking import rank_candidates, NEAR_EXACT_SCORE
+from .ratelimit import RateLimiter
+from .retry import RetryPolicy, CircuitBreaker, CircuitOpenError, OPACBlockedError, classify_error, PERMANENT
+from .transport import MAX_REDIRECTS, REDIRECT_STATUS, resolve_route, decode_body, count_bytes
+
+
+class _CookieResponse:
+    '''
+    供 CookieJar.extract_cookies 使用的响应对象。
+    '''
+
+    def __init__(self, headers):
+        self._headers = headers
+
+    def info(self):
+        return self._headers
+
+
+class AsyncHTTPClient:
+    '''
+    异步HTTP/1.1客户端，按主机复用长连接，并共享Cookie。响应按 Content-Encoding 自动解压。
+    '''
+
+    def __init__(self, headers=None, timeout=10):
+        '''
+        :param headers: 每个请求附带的默认请求头。
+        :param timeout: 单个请求的超时时间（单位：秒）。
+        '''
+        self.headers = {k: v for k, v in (headers or {}).items()
+                        if k.lower() not in ('host', 'proxy-connection', 'connection')}
+        self.headers['Connection'] = 'keep-alive'
+        self.timeout = timeout
+        self.cookie_jar = http.cookiejar.CookieJar()
+        self._idle = {}
+
+    async def _open(self, key):
+        scheme, host, port = key
+        return await asyncio.open_connection(host, port, ssl=(scheme == 'https') or None)
+
+    async def _read_response(self, reader):
+        '''
+        读取一个完整的响应。
+        :return: (状态码, 原因, 响应头, 响应体, 连接是否可复用)
+        '''
+        while True:
+            status_line = await reader.readline()
+            if not status_line:
+                raise ConnectionResetError("连接已被服务器关闭")
+            version, status, reason = (status_line.decode('iso-8859-1').rstrip('\r\n').split(' ', 2) + [''])[:3]
+            status = int(status)
+
+            header_lines = []
+            while True:
+                line = await reader.readline()
+                header_lines.append(line)
+                if line in (b'\r\n', b'\n', b''):
+                    break
+            headers = http.client.parse_headers(io.BytesIO(b''.join(header_lines)))
+            # 跳过 100 Continue 等中间响应
+            if status >= 200:
+                break
+
+        keep_alive = version == 'HTTP/1.1'
+        connection = (headers.get('Connection') or '').lower()
+        if 'close' in connection:
+            keep_alive = False
+        elif 'keep-alive' in connection:
+            keep_alive = True
+
+        if status in (204, 304):
+            body = b''
+        elif 'chunked' in (headers.get('Transfer-Encoding') or '').lower():
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b';', 1)[0].strip(), 16)
+                if size == 0:
+                    # 读取尾部字段直到空行
+                    while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readline()
+            body = b''.join(chunks)
+        elif headers.get('Content-Length') is not None:
+            body = await reader.readexactly(int(headers['Content-Length']))
+        else:
+            body = await reader.read()
+            keep_alive = False
+
+        return status, reason, headers, body, keep_alive
+
+    async def _send(self, url, headers):
+        '''
+        发送一次GET请求。复用的长连接已被服务器关闭时，自动换新连接重试。
+        :return: (状态码, 原因, 响应头, 响应体)
+        '''
+        key, path = resolve_route(url)
+        request = urllib.request.Request(url, headers=headers)
+        self.cookie_jar.add_cookie_header(request)
+        host = urllib.parse.urlsplit(url).netloc
+        lines = [f'GET {path} HTTP/1.1', f'Host: {host}']
+        lines.extend(f'{k}: {v}' for k, v in request.header_items())
+        payload = ('\r\n'.join(lines) + '\r\n\r\n').encode('utf-8')
+
+        while True:
+            idle = self._idle.get(key)
+            reused = bool(idle)
+            reader, writer = idle.pop() if reused else await self._open(key)
+            try:
+                writer.write(payload)
+                await writer.drain()
+                status, reason, response_headers, body, keep_alive = await self._read_response(reader)
+            except (ConnectionError, asyncio.IncompleteReadError) as e:
+                writer.close()
+                if reused:
+                    Metrics.get_instance().add('connection_retries')
+                    continue
+                raise urllib.error.URLError(e)
+            except BaseException:
+                writer.close()
+                raise
+            if keep_alive:
+                self._idle.setdefault(key, []).append((reader, writer))
+            else:
+                writer.close()
+            self.cookie_jar.extract_cookies(_CookieResponse(response_headers), request)
+            return status, reason, response_headers, body
+
+    async def get(self, url, headers=None):
+        '''
+        下载页面，自动跟随重定向。
+        :return: (最终URL, 响应头, 解压后的响应体)
+        '''
+        request_headers = dict(self.headers)
+        if headers:
+            request_headers.update(headers)
+
+        for _ in range(MAX_REDIRECTS + 1):
+            status, reason, response_headers, body = await asyncio.wait_for(
+                self._send(url, request_headers), self.timeout)
+            if status in REDIRECT_STATUS and response_headers.get('Location'):
+                url = urllib.parse.urljoin(url, response_headers['Location'])
+                continue
+            if status >= 400:
+                raise urllib.error.HTTPError(url, status, reason, response_headers, None)
+            decoded = decode_body(response_headers, body)
+            count_bytes(len(body), len(decoded))
+            return url, response_headers, decoded
+        raise urllib.error.URLError(f"重定向次数过多: {url}")
+
+    async def get_text(self, url, encoding='utf-8'):
+        _, _, body = await self.get(url)
+        return body.decode(encoding)
+
+    def close(self):
+        for connections in self._idle.values():
+            for _, writer in connections:
+                writer.close()
+        self._idle.clear()
+
+
+class AsyncEngine:
+    '''
+    异步查询引擎。
+
+    在后台线程中运行一个事件循环，所有查询都提交到该循环中执行。
+    '''
+
+    # 单例模式
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, max_concurrency=MAX_WORKERS):
+        '''
+        :param max_concurrency: 同时进行的请求数上限。
+        '''
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name='NLCISBNAsyncEngine', daemon=True)
+        self._thread.start()
+
+        self.client = AsyncHTTPClient(HEADERS)
+        # 执行解析、SQLite读写等同步操作的线程池
+        self._executor = self._new_executor()
+        self._session_url = None
+        # 以下对象需在事件循环中创建
+        self._session_lock = None
+        self._semaphore = None
+
+    @classmethod
+    def get_instance(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def configure(self, max_concurrency):
+        '''
+        调整并发数，在下一次提交查询时生效。
+        :param max_concurrency: 同时进行的请求数上限。
+        '''
+        max_concurrency = max(1, int(max_concurrency))
+        if max_concurrency != self.max_concurrency:
+            self.max_concurrency = max_concurrency
+            self._semaphore = None
+            old_executor, self._executor = self._executor, self._new_executor()
+            old_executor.shutdown(wait=False)
+
+    def _new_executor(self):
+        return ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix='NLCISBNAsyncWorker')
+
+    async def offload(self, fn, *args):
+        '''
+        在线程池中执行同步函数，事件循环在此期间继续处理其他请求。
+        :param fn: 同步函数。
+        :return: 函数的返回值。
+        '''
+        return await self.loop.run_in_executor(self._executor, functools.partial(fn, *args))
+
+    def run(self, coro, timeout=None):
+        '''
+        在事件循环中执行协程，并阻塞等待结果。
+        :param coro: 协程。
+        :param timeout: 超时时间（单位：秒）。
+        :return: 协程的返回值。
+        '''
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    async def download_html(self, url):
+        '''
+        异步下载一次页面，不重试。与同步的 download_html 一样接受全局限速器的调度与反馈。
+        '''
+        metrics = Metrics.get_instance()
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        limiter = RateLimiter.get_instance()
+        async with self._semaphore:
+            wait = limiter.reserve()
+            metrics.observe('rate_wait', wait)
+            await asyncio.sleep(wait)
+            metrics.add('requests')
+            try:
+                with metrics.timer('download'):
+                    _, _, body = await self.client.get(url)
+            except urllib.error.HTTPError as e:
+                metrics.add('http_errors')
+                if e.code >= 500 or e.code == 429:
+                    limiter.on_failure()
+                raise
+            except (OSError, asyncio.TimeoutError):
+                # 超时、连接失败等；Python 3.11 之前 asyncio.wait_for 超时抛出的 asyncio.TimeoutError 不是 OSError
+                metrics.add('network_errors')
+                limiter.on_failure()
+                raise
+        response_text = body.decode('utf-8')
+        if BLOCK_PAGE_PATTERN.search(response_text):
+            metrics.add('blocked')
+            limiter.on_failure()
+            raise OPACBlockedError("请求过于频繁，已被OPAC拦截")
+        limiter.on_success()
+        return response_text
+
+    async def fetch_html(self, url, isbn=None, store=True, log=None, search=None):
+        '''
+        fetch_html 的异步版本：同样支持存档的录制与回放，并共用重试策略与熔断器。
+        '''
+        metrics = Metrics.get_instance()
+        archive, replay = ResponseArchive.active()
+        if replay:
+            response_text = await self.offload(archive.get, url, isbn, search)
+            if response_text is None:
+                raise urllib.error.URLError(f"存档中没有该页面: {url}")
+            metrics.add('archive_reads')
+            return response_text
+
+        policy = RetryPolicy.get_instance()
+        breaker = CircuitBreaker.get_instance()
+        attempt = 0
+        while True:
+            try:
+                breaker.before_call(log)
+            except CircuitOpenError:
+                metrics.add('circuit_rejections')
+                raise
+            try:
+                response_text = await self.download_html(url)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if classify_error(e) == PERMANENT:
+                    breaker.record_success(log)
+                    raise
+                if breaker.record_failure(log) or attempt >= policy.max_retries:
+                    raise
+                delay = policy.backoff(attempt)
+                attempt += 1
+                metrics.add('retries')
+                if log is not None:
+                    log.info(f"请求失败（{e}），{delay:.1f} 秒后第 {attempt} 次重试: {url}")
+                await asyncio.sleep(delay)
+                continue
+            breaker.record_success(log)
+            break
+
+        if archive is not None and store:
+            await self.offload(archive.put, url, response_text, isbn, search)
+        return response_text
+
+    async def get_session_url(self, log):
+        if self._session_lock is None:
+            self._session_lock = asyncio.Lock()
+        async with self._session_lock:
+            if self._session_url is None:
+                with Metrics.get_instance().timer('session'):
+                    self._session_url = extract_dynamic_url(await self.fetch_html(BASE_URL, store=False, log=log))
+                log.info(f"已建立OPAC会话: {self._session_url}")
+            return self._session_url
+
+    async def fetch_query(self, query, log, isbn=None):
+        '''
+        通过当前会话发出检索请求，会话过期时自动刷新并重试一次。回放模式下直接从存档读取。
+        '''
+        if ResponseArchive.active()[1]:
+            return await self.fetch_html(BASE_URL + query, isbn=isbn, log=log)
+        for attempt in range(2):
+            session_url = await self.get_session_url(log)
+            response_text = await self.fetch_html(session_url + query, isbn=isbn, log=log)
+            if attempt == 0 and SESSION_EXPIRED_PATTERN.search(response_text):
+                log.info("OPAC会话已过期，正在刷新...")
+                Metrics.get_instance().add('session_refreshes')
+                if self._session_url == session_url:
+                    self._session_url = None
+                continue
+            return response_text
+        return response_text
+
+    async def search_isbn(self, isbn, log, cache_key=None, max_hits=MAX_ISBN_HITS):
+        '''
+        search_isbn 的异步版本。
+        '''
+        with Metrics.get_instance().timer('search'):
+            response_text = await self.fetch_query(SEARCH_QUERY_TEMPLATE.format(isbn=isbn), log, isbn=cache_key)
+        return await self.offload(parse_isbn_search, response_text, isbn, log, max_hits)
+
+    async def search_isbn_forms(self, forms, log, cache_key, max_hits=MAX_ISBN_HITS):
+        '''
+        search_isbn_forms 的异步版本，命中后取消另一检索。
+        '''
+        pending = {asyncio.ensure_future(self.search_isbn(form, log, cache_key, max_hits)): form for form in forms}
+        outcomes = []
+        try:
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    form = pending.pop(task)
+                    try:
+                        hit = task.result()
+                    except Exception as e:
+                        log.info(f"按 {form} 检索失败: {e}")
+                        outcomes.append((None, e))
+                        continue
+                    outcomes.append((hit, None))
+                    if is_found(hit):
+                        if form != forms[0]:
+                            log.info(f"按 {forms[0]} 未找到，按 {form} 找到记录")
+                        return hit
+        finally:
+            for task in pending:
+                task.cancel()
+        return pick_first_hit(outcomes)
+
+    async def iter_completed(self, start, jobs, log, deadline=None, hold=None):
+        '''
+        iter_completed 的异步版本，同时进行的任务不超过并发数。
+        :param start: 参数为 jobs 中的元素、返回协程的函数。
+        '''
+        pending = {}
+        try:
+            while jobs or pending:
+                while jobs and len(pending) < self.max_concurrency:
+                    if hold is not None and hold(jobs[0], list(pending.values())):
+                        break
+                    job = jobs.pop(0)
+                    pending[asyncio.ensure_future(start(job))] = job
+                if not pending:
+                    break
+
+                remaining = deadline - time.monotonic() if deadline else None
+                done = None
+                if remaining is None or remaining > 0:
+                    done, _ = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    log.info(f"检索超时，放弃尚未完成的 {len(pending)} 条全记录")
+                    return
+                for task in done:
+                    yield pending.pop(task), task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def url2record(self, url, isbn, log, abort=None, search=None):
+        '''
+        url2record 的异步版本。
+        '''
+        if abort is not None and abort.is_set():
+            return None
+        try:
+            record = await self.offload(parse_record, await self.fetch_html(record_url(url), log=log, search=search), isbn, log)
+            if record is None and RECORD_FORMAT != TABLE_RECORD_FORMAT:
+                log_record_fallback(url, log)
+                html = await self.fetch_html(record_url(url, TABLE_RECORD_FORMAT), log=log, search=search)
+                record = await self.offload(parse_record, html, isbn, log)
+            return record
+        except Exception as e:
+            log.error(f"获取全记录失败 {url}: {e}")
+            return None
+
+    async def fetch_isbn_records(self, links, isbn, log, on_record=None, abort=None, timeout=None):
+        '''
+        fetch_isbn_records 的异步版本，同时进行的下载不超过并发数。
+        '''
+        deadline = time.monotonic() + timeout if timeout else None
+        results = self.iter_completed(lambda job: self.url2record(job[1], isbn, log, abort, isbn),
+                                      list(enumerate(links)), log, deadline)
+        records = {}
+        try:
+            async for (index, _), record in results:
+                if record is not None:
+                    records[index] = record
+                    if on_record is not None:
+                        await self.offload(on_record, record)
+                if abort is not None and abort.is_set():
+                    log.info("检索已取消")
+                    break
+        finally:
+            await results.aclose()
+        return [records[index] for index in sorted(records)]
+
+    async def isbn2records(self, isbn, log, cache=None, dual_lookup=DUAL_ISBN_LOOKUP, on_record=None,
+                           max_hits=MAX_ISBN_HITS, abort=None, timeout=None):
+        '''
+        isbn2records 的异步版本。
+        '''
+        isbn = validate_isbn(isbn, log)
+
+        cache_key = to_isbn13(isbn) or isbn
+        hit, records = await self.offload(get_cached_records, cache, cache_key, log)
+        if hit:
+            if on_record is not None:
+                for record in records:
+                    await self.offload(on_record, record)
+            return records
+
+        forms = isbn_variants(isbn) if dual_lookup else [isbn]
+        if len(forms) == 1:
+            record, links = await self.search_isbn(isbn, log, cache_key, max_hits)
+        else:
+            record, links = await self.search_isbn_forms(forms, log, cache_key, max_hits)
+        if record is not None:
+            records = [record]
+            if on_record is not None:
+                await self.offload(on_record, record)
+        elif links:
+            records = await self.fetch_isbn_records(links, isbn, log, on_record, abort, timeout)
+        else:
+            records = []
+        # 部分全记录获取失败时不写入缓存，下次重新检索
+        if cache is not None and cache_key and (record is not None or len(records) == len(links)):
+            await self.offload(cache.put, cache_key, records_to_cache(records))
+        return records
+
+    async def isbn2parse(self, isbn, log, cache=None, dual_lookup=DUAL_ISBN_LOOKUP):
+        '''
+        isbn2parse 的异步版本。
+        '''
+        records = await self.isbn2records(isbn, log, cache, dual_lookup)
+        return await self.offload(record_to_dict, records[0] if records else None)
+
+    async def title2metadata(self, title, log, result_queue, clean_downloaded_metadata,
+                             max_title_list_num=MAX_TITLE_LIST_NUM, authors=None, abort=None, timeout=None,
+                             early_stop_matches=EARLY_STOP_MATCHES):
+        '''
+        title2metadata 的异步版本，按相关度从高到低并发下载全记录页面。
+        '''
+        if not isinstance(title, str):
+            raise TypeError("title必须是字符串")
+
+        deadline = time.monotonic() + timeout if timeout else None
+        query = title
+        if IS_FUZZY_SEARCH_WITH_AUTHOR and authors and isinstance(authors, list):
+            query += authors[0]
+
+        query = urllib.parse.quote(f"{query}")
+        with Metrics.get_instance().timer('search'):
+            response_text = await self.fetch_query(SEARCH_QUERY_TEMPLATE_TITLE.format(title=query), log)
+        titlelist, total = await self.offload(parse_search_list, response_text, log)
+        candidates = rank_candidates(titlelist, title, authors, limit=max_title_list_num, log=log)
+        log.info(f"按相关度保留 {len(candidates)} 条: " + ', '.join(f"{score:.2f}" for score, _, _ in candidates))
+        if abort is not None and abort.is_set():
+            return []
+
+        # 按得分从高到低提交，同时进行的下载不超过并发数；每得到一条记录立即转换并放入结果队列
+        results = self.iter_completed(
+            lambda candidate: self.url2record(candidate[2], None, log, abort, title), candidates, log, deadline,
+            # 先确认几乎一致的条目，再决定是否下载其余条目
+            hold=lambda candidate, running: candidate[0] < NEAR_EXACT_SCORE and any(
+                score >= NEAR_EXACT_SCORE for score, _, _ in running)
+        )
+        metadatas = []
+        confident = 0
+        try:
+            async for (score, _, _), record in results:
+                if record is not None:
+                    metadata = await self.offload(deliver_record, record, log, result_queue, clean_downloaded_metadata)
+                    metadatas.append(metadata)
+                    if is_confident_match(metadata, title) or score >= NEAR_EXACT_SCORE:
+                        confident += 1
+                        # 已找到几乎一致的结果后，只继续下载同样几乎一致的条目（如同一书的不同版本）
+                        candidates[:] = [candidate for candidate in candidates if candidate[0] >= NEAR_EXACT_SCORE]
+
+                if abort is not None and abort.is_set():
+                    log.info("检索已取消")
+                    break
+                if early_stop_matches and confident >= early_stop_matches:
+                    log.info(f"已得到 {confident} 条与标题吻合的结果，提前结束")
+                    break
+        finally:
+            await results.aclose()
+        return metadatas
+
+
+def isbn2meta(isbn, log, cache=None, dual_lookup=DUAL_ISBN_LOOKUP):
+    '''
+    将ISBN转换为元数据（异步引擎）。参数与返回值同 isbn2meta。
+    '''
+    engine = AsyncEngine.get_instance()
+    return to_metadata(engine.run(engine.isbn2parse(isbn, log, cache, dual_lookup)), False, log)
+
+
+def isbn2metadata(isbn, log, result_queue, clean_downloaded_metadata, cache=None, dual_lookup=DUAL_ISBN_LOOKUP,
+                  max_workers=MAX_WORKERS, max_hits=MAX_ISBN_HITS, abort=None, timeout=None):
+    '''
+    根据ISBN获取元数据（异步引擎），每得到一条结果就放入 result_queue。参数与返回值同 isbn2metadata。
+    '''
+    metadatas = []
+
+    def put(record):
+        metadatas.append(deliver_record(record, log, result_queue, clean_downloaded_metadata))
+
+    engine = AsyncEngine.get_instance()
+    engine.configure(max_workers)
+    engine.run(engine.isbn2records(isbn, log, cache, dual_lookup, on_record=put, max_hits=max_hits,
+                                   abort=abort, timeout=timeout))
+    return metadatas
+
+
+def title2metadata(title, log, result_queue, clean_downloaded_metadata, max_workers=MAX_WORKERS, max_title_list_num=MAX_TITLE_LIST_NUM,
+                   authors=None, abort=None, timeout=None, early_stop_matches=EARLY_STOP_MATCHES):
+    '''
+    根据标题获取元数据（异步引擎）。参数与返回值同 title2metadata。
+    '''
+    engine = AsyncEngine.get_instance()
+    engine.configure(max_workers)
+    return engine.run(engine.title2metadata(title, log, result_queue, clean_downloaded_metadata,
+                                            max_title_list_num=max_title_list_num, authors=authors, abort=abort,
+                                            timeout=timeout, early_stop_matches=early_stop_matches))
@@ -0,0 +1,191 @@
+'''
+批量ISBN识别。
+
+identify_many 对输入的ISBN去重后，交由同一个线程池处理，所有请求共用全局限速器，
+结果按完成顺序逐条返回，并可写入检查点文件以便中断后继续。
+
+命令行用法（在源码目录下，通过calibre自带的Python运行）：
+
+    calibre-debug -c "from src.batch import main; main(['isbns.txt', '-o', 'result.jsonl', '--checkpoint', 'sync.ckpt'])"
+
+加上 --archive 可同时保存原始页面；之后用 --archive 与 --replay 离线重新解析存档中的全部记录：
+
+    calibre-debug -c "from src.batch import main; main(['--archive', 'pages.sqlite', '--replay', '-o', 'reparsed.jsonl'])"
+'''
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from calibre.utils.logging import default_log
+
+from . import (HEADERS, MAX_WORKERS, CACHE_PATH, canonical, to_isbn13, isbn2parse)
+from .archive import ResponseArchive
+from .cache import MetadataCache
+from .ratelimit import RateLimiter
+from .transport import HTTPTransport
+
+# 批量识别时默认的全局请求速率（次/秒）
+DEFAULT_RATE = 2
+
+
+def normalize_isbns(isbns):
+    '''
+    标准化并去重ISBN，保持输入顺序。无效的ISBN不去重。
+    :param isbns: ISBN字符串的可迭代对象。
+    :return: [(标准化后的ISBN, 原始输入)]，无效的ISBN标准化结果为空字符串。
+    '''
+    seen = set()
+    result = []
+    for raw in isbns:
+        raw = raw.strip()
+        if not raw:
+            continue
+        isbn = to_isbn13(raw) or canonical(raw)
+        # 无效的ISBN不去重，每条都报告错误
+        if isbn and isbn in seen:
+            continue
+        if isbn:
+            seen.add(isbn)
+        result.append((isbn, raw))
+    return result
+
+
+def load_checkpoint(path):
+    '''
+    读取检查点文件中已完成的ISBN。出错的ISBN不计入，恢复时会重新查询。
+    :param path: 检查点文件路径。
+    :return: 已完成的ISBN集合。
+    '''
+    done = set()
+    if not path or not os.path.exists(path):
+        return done
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # 中断时可能留下不完整的最后一行
+                continue
+            if not entry.get('error'):
+                done.add(entry['isbn'])
+    return done
+
+
+def identify_many(isbns, log=default_log, max_workers=MAX_WORKERS, rate=DEFAULT_RATE, max_rate=None,
+                  cache=None, checkpoint=None, abort=None):
+    '''
+    批量根据ISBN获取元数据。
+
+    :param isbns: ISBN字符串的可迭代对象。
+    :param log: 日志记录器。
+    :param max_workers: 线程池大小。
+    :param rate: 全局初始请求速率（次/秒），0表示不限速。
+    :param max_rate: 自适应调节的速率上限，默认等于初始速率。
+    :param cache: 可选的 MetadataCache。
+    :param checkpoint: 检查点文件路径，已记录的ISBN会被跳过。
+    :param abort: 可选的 threading.Event，置位后不再提交新的查询。
+    :return: 生成器，按完成顺序产出 (ISBN, 解析结果或None, 异常或None)。
+             调用方取下一条结果时，上一条才写入检查点，因此中断时尚未处理完的结果会在恢复后重新查询。
+    '''
+    RateLimiter.get_instance().configure(rate=rate, max_rate=max_rate)
+    # 连接池大小与线程数一致，避免线程等待空闲连接
+    HTTPTransport.get_instance(HEADERS).resize(max_workers)
+
+    done = load_checkpoint(checkpoint)
+    pending = []
+    for isbn, raw in normalize_isbns(isbns):
+        if not isbn:
+            yield raw, None, ValueError(f"无效的ISBN代码: {raw}")
+        elif isbn not in done:
+            pending.append(isbn)
+    if done:
+        log.info(f"从检查点恢复，跳过 {len(done)} 条已完成的ISBN")
+    log.info(f"共 {len(pending)} 条ISBN待查询")
+
+    checkpoint_file = open(checkpoint, 'a', encoding='utf-8') if checkpoint else None
+
+    def lookup(isbn):
+        try:
+            return isbn, isbn2parse(isbn, log, cache, max_workers=max_workers), None
+        except Exception as e:
+            log.error(f"查询失败 {isbn}: {e}")
+            return isbn, None, e
+
+    def save_checkpoint(result):
+        isbn, metadata, error = result
+        entry = {'isbn': isbn, 'metadata': metadata, 'error': str(error) if error else None}
+        checkpoint_file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        checkpoint_file.flush()
+
+    # 限制同时提交的任务数，避免一次性为所有ISBN创建任务
+    window = max_workers * 2
+    isbn_iter = iter(pending)
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = set()
+            while True:
+                while len(futures) < window and not (abort and abort.is_set()):
+                    isbn = next(isbn_iter, None)
+                    if isbn is None:
+                        break
+                    futures.add(executor.submit(lookup, isbn))
+                if not futures:
+                    break
+                finished, futures = wait(futures, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    result = future.result()
+                    yield result
+                    # 调用方已处理完该结果（如已写入输出文件）
+                    if checkpoint_file:
+                        save_checkpoint(result)
+    finally:
+        if checkpoint_file:
+            checkpoint_file.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='从中国国家图书馆批量获取ISBN元数据，结果以JSON Lines格式输出。')
+    parser.add_argument('input', nargs='?', help='ISBN列表文件，每行一个；“-”表示从标准输入读取')
+    parser.add_argument('-o', '--output', help='输出文件，默认为标准输出')
+    parser.add_argument('--checkpoint', help='检查点文件，中断后再次运行时跳过已完成的ISBN')
+    parser.add_argument('--workers', type=int, default=MAX_WORKERS, help='线程数')
+    parser.add_argument('--rate', type=float, default=DEFAULT_RATE, help='全局初始请求速率（次/秒）')
+    parser.add_argument('--max-rate', type=float, help='自适应调节的速率上限（次/秒）')
+    parser.add_argument('--no-cache', action='store_true', help='不使用本地缓存')
+    parser.add_argument('--archive', help='原始页面存档文件，下载的页面将写入该存档')
+    parser.add_argument('--replay', action='store_true',
+                        help='只从存档读取页面并重新解析，不访问网络，也不使用本地缓存；不指定输入文件时处理存档中的全部ISBN')
+    args = parser.parse_args(argv)
+
+    if args.replay and not args.archive:
+        parser.error('--replay 需要同时指定 --archive')
+    if args.input is None and not args.replay:
+        parser.error('需要指定ISBN列表文件')
+    if args.archive:
+        archive = ResponseArchive.activate(args.archive, replay=args.replay)
+
+    if args.replay and args.input is None:
+        isbns = archive.isbns()
+    elif args.input == '-':
+        isbns = sys.stdin.read().splitlines()
+    else:
+        with open(args.input, encoding='utf-8') as f:
+            isbns = f.read().splitlines()
+
+    cache = None if args.no_cache or args.replay else MetadataCache.get_instance(CACHE_PATH)
+    output = open(args.output, 'a', encoding='utf-8') if args.output else sys.stdout
+    try:
+        for isbn, metadata, error in identify_many(isbns, max_workers=args.workers, rate=args.rate,
+                                                   max_rate=args.max_rate, cache=cache, checkpoint=args.checkpoint):
+            entry = {'isbn': isbn, 'metadata': metadata, 'error': str(error) if error else None}
+            output.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            output.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class MetadataCache:
+    '''
+    ISBN→全记录的持久化缓存。
+
+    使用SQLite存储全记录的原始字段（NLCRecord.to_json），键为规范化后的ISBN-13。
+    读取时按当前选项重新派生元数据，修改选项后无需重新下载。
+    支持过期时间（TTL）、容量上限（按最近访问时间淘汰，即LRU）以及“未找到”结果的缓存。
+    '''
+
+    # 单例模式，按数据库路径区分
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, path, ttl=30 * 86400, max_entries=50000, negative_ttl=86400):
+        '''
+        :param path: SQLite数据库文件路径。
+        :param ttl: 正常结果的有效期（单位：秒）。
+        :param max_entries: 最多缓存多少条记录，超出后淘汰最久未访问的记录。
+        :param negative_ttl: “未找到”结果的有效期（单位：秒）。
+        '''
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.negative_ttl = negative_ttl
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS metadata ('
+            'isbn TEXT PRIMARY KEY, '
+            'data TEXT, '
+            'created REAL NOT NULL, '
+            'accessed REAL NOT NULL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS metadata_accessed ON metadata (accessed)')
+        self._conn.commit()
+
+    @classmethod
+    def get_instance(cls, path):
+        with cls._instances_lock:
+            instance = cls._instances.get(path)
+            if instance is None:
+                instance = cls._instances[path] = cls(path)
+            return instance
+
+    def configure(self, ttl=None, max_entries=None, negative_ttl=None):
+        '''
+        更新缓存参数，未传入的参数保持不变。
+        '''
+        if ttl is not None:
+            self.ttl = ttl
+        if max_entries is not None:
+            self.max_entries = max_entries
+        if negative_ttl is not None:
+            self.negative_ttl = negative_ttl
+
+    def get(self, isbn):
+        '''
+        查询缓存。
+
+        :param isbn: 规范化后的ISBN-13。
+        :return: (是否命中, 解析结果)。命中“未找到”结果时返回 (True, None)。
+        '''
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT data, created FROM metadata WHERE isbn = ?', (isbn,)
+            ).fetchone()
+            if row is None:
+                return False, None
+
+            data, created = row
+            ttl = self.ttl if data is not None else self.negative_ttl
+            if now - created > ttl:
+                self._conn.execute('DELETE FROM metadata WHERE isbn = ?', (isbn,))
+                self._conn.commit()
+                return False, None
+
+            self._conn.execute('UPDATE metadata SET accessed = ? WHERE isbn = ?', (now, isbn))
+            self._conn.commit()
+
+        return True, json.loads(data) if data is not None else None
+
+    def put(self, isbn, metadata):
+        '''
+        写入缓存。
+
+        :param isbn: 规范化后的ISBN-13。
+        :param metadata: 解析结果字典；为None时记录为“未找到”。
+        '''
+        if metadata is None and self.negative_ttl <= 0:
+            return
+        now = time.time()
+        data = json.dumps(metadata, ensure_ascii=False) if metadata is not None else None
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO metadata (isbn, data, created, accessed) VALUES (?, ?, ?, ?)',
+                (isbn, data, now, now)
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        '''
+        超出容量上限时，淘汰最久未访问的记录。调用方需持有锁。
+        '''
+        if self.max_entries <= 0:
+            return
+        count = self._conn.execute('SELECT COUNT(*) FROM metadata').fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                'DELETE FROM metadata WHERE isbn IN '
+                '(SELECT isbn FROM metadata ORDER BY accessed LIMIT ?)',
+                (overflow,)
+            )
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute('DELETE FROM metadata')
+            self._conn.commit()
@@ -1,7 +1,26 @@
+import argparse
+import functools
 import json
 import re
 import os
-from .data_wrapper import data as tree
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+
+# 分类号→标签的缓存条数上限
+RESOLVE_CACHE_SIZE = 4096
+
+
+def load_tree():
+    """
+    导入中图分类树数据。数据量较大，仅在首次需要时导入。
+    
+    :return: 中图分类树数据
+    """
+    from .data_wrapper import data
+    return data
+
 
 class Parser:
     # 不含复分信息的正则表达式
@@ -11,21 +30,35 @@ class Parser:
     REGEX_CLC_CLASSIC_V5_STRICT = r'(?:[A-K]|[N-V]|X|Z)[A-Z]?\d{0,3}'
 
     def __init__(self):
-        self.clean_regex = self.generate_clean_regex()
-        # 加载数据文件
-        # 注意: 实际使用时需要有一个data.json文件
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        
-        self.clc_tree_regex = self.load_tree_json(tree)
-        self.clc_info = self.load_clc_info(tree)
+        self.clean_regex = re.compile(self.generate_clean_regex())
+        # 优先使用预编译的索引（由 build_index_module 生成），否则从分类树构建
+        try:
+            from .clc_index_data import index, info
+        except ImportError:
+            tree = load_tree()
+            index = self.load_prefix_index(tree)
+            info = self.load_clc_info(tree)
+        self.clc_index = index
+        self.clc_info = info
+        # 正则规则树仅用于对照，首次使用时才构建
+        self._clc_tree_regex = None
 
-    # 单例模式
+    @property
+    def clc_tree_regex(self):
+        if self._clc_tree_regex is None:
+            self._clc_tree_regex = self.load_tree_json(load_tree())
+        return self._clc_tree_regex
+
+    # 单例模式，首次使用时才构建
     _instance = None
+    _instance_lock = threading.Lock()
     
     @classmethod
     def get_instance(cls):
         if cls._instance is None:
-            cls._instance = cls()
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
         return cls._instance
 
     @classmethod
@@ -50,6 +83,80 @@ class Parser:
         
         return result
 
+    @classmethod
+    def classify(cls, s):
+        """
+        解析图书的中图分类号信息，取第一个分类号的分类路径
+        
+        :param s: 复杂的图书中图分类号信息
+        :return: (一到三级中图分类号的列表, 对应的分类名称列表)
+        """
+        parsed_clc = cls.parse(s)
+        path = list(parsed_clc.values())[0] if parsed_clc else []
+        if not path:
+            return [], []
+        return path, cls.get_clc_info_by_code(path[-1]).get('namePath', [])
+
+    @classmethod
+    def parse_many(cls, codes, processes=0, batch_size=5000):
+        """
+        批量解析中图分类号信息，用于离线重新生成标签。
+        输入先去重，重复项直接复用结果；processes大于1时，每批中的新分类号分给多个进程解析。
+        
+        :param codes: 中图分类号信息的可迭代对象
+        :param processes: 进程数，0或1表示在当前进程中解析
+        :param batch_size: 每批读取的输入条数
+        :return: 生成器，按输入顺序产出 (输入, 分类号列表, 分类名称列表)
+        """
+        results = {}
+        executor = ProcessPoolExecutor(processes) if processes and processes > 1 else None
+        try:
+            batch = []
+            for s in codes:
+                batch.append(s)
+                if len(batch) >= batch_size:
+                    yield from cls._parse_batch(batch, results, executor, processes)
+                    batch = []
+            if batch:
+                yield from cls._parse_batch(batch, results, executor, processes)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+    @classmethod
+    def _parse_batch(cls, batch, results, executor, processes):
+        pending = [s for s in dict.fromkeys(batch) if s not in results]
+        if executor is None:
+            results.update(zip(pending, _classify_chunk(pending)))
+        elif pending:
+            chunk_size = -(-len(pending) // processes)
+            chunks = [pending[i:i + chunk_size] for i in range(0, len(pending), chunk_size)]
+            for chunk, chunk_results in zip(chunks, executor.map(_classify_chunk, chunks)):
+                results.update(zip(chunk, chunk_results))
+        for s in batch:
+            path, name_path = results[s]
+            yield s, path, name_path
+
+    @classmethod
+    def resolve_tag(cls, s, level):
+        """
+        将图书的中图分类号信息转换为标签，结果按 (s, level) 缓存，多线程共享
+        
+        :param s: 复杂的图书中图分类号信息
+        :param level: 解析层级，1到3
+        :return: 标签字符串，无法得到标签时返回None
+        """
+        return _resolve_tag(s, level)
+
+    @classmethod
+    def resolve_cache_info(cls):
+        """
+        查询 resolve_tag 缓存的命中情况
+        
+        :return: functools.lru_cache 的统计信息，含 hits、misses、maxsize、currsize
+        """
+        return _resolve_tag.cache_info()
+
     @classmethod
     def get_clc_info_by_code(cls, code):
         """
@@ -63,7 +170,25 @@ class Parser:
 
     def parse_code(self, code):
         """
-        解析单个中图分类号
+        解析单个中图分类号，在前缀索引中查找最长的匹配前缀
+        
+        :param code: 单个中图分类号
+        :return: 一到三级中图分类号的列表
+        """
+        code = self.clean(code)
+        if not code:
+            return []
+        
+        index = self.clc_index
+        for end in range(len(code), 0, -1):
+            path = index.get(code[:end])
+            if path is not None:
+                return list(path)
+        return []
+
+    def parse_code_by_regex(self, code):
+        """
+        使用正则规则树逐级解析单个中图分类号（原实现，用于对照）
         
         :param code: 单个中图分类号
         :return: 一到三级中图分类号的列表
@@ -118,7 +243,7 @@ class Parser:
         :return: 清洗后的中图分类号
         """
         s = s.strip()
-        match = re.search(self.clean_regex, s)
+        match = self.clean_regex.search(s)
         return match.group(1) if match else ''
 
     def load_clc_info(self, tree):
@@ -165,6 +290,49 @@ class Parser:
         
         return result
 
+    def load_prefix_index(self, tree):
+        """
+        构建前缀索引：每个展开后的中图分类号（含所有子孙节点）对应其一到三级分类路径。
+        同一分类号出现在多处时，以分类树中靠前的为准，与逐级正则匹配的顺序一致。
+        
+        :param tree: 从json加载的中图分类树数据
+        :return: {中图分类号: (一级, 二级, 三级)} 形式的字典，路径长度为1到3
+        """
+        index = {}
+        
+        def add(node, path):
+            for code in self.parse_clc_code_str(node['code']):
+                index.setdefault(code, path)
+            for child in node.get('children', []):
+                child_path = path + (child['code'],) if len(path) < 3 else path
+                add(child, child_path)
+        
+        for first in tree:
+            add(first, (first['code'],))
+        
+        return index
+
+    @classmethod
+    def build_index_module(cls, path=None):
+        """
+        将前缀索引和分类信息序列化为Python模块（clc_index_data.py），与data_wrapper一同发布，
+        之后创建Parser时直接加载，无需再遍历分类树。分类数据更新后需重新生成。
+        
+        :param path: 输出文件路径，默认为本模块所在目录下的clc_index_data.py
+        :return: 输出文件路径
+        """
+        if path is None:
+            path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'clc_index_data.py')
+        instance = cls.get_instance()
+        tree = load_tree()
+        index = instance.load_prefix_index(tree)
+        info = instance.load_clc_info(tree)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('# 由 clc_parser.Parser.build_index_module 根据 data_wrapper 生成，请勿手动修改\n')
+            f.write(f'index = {index!r}\n')
+            f.write(f'info = {info!r}\n')
+        return path
+
     def load_tree_json(self, tree):
         """
         加载资源文件，获得中图分类树状结构
@@ -299,6 +467,53 @@ class Parser:
         return regex_clc_complete
 
 
+
+@functools.lru_cache(maxsize=RESOLVE_CACHE_SIZE)
+def _resolve_tag(s, level):
+    parsed_clc = Parser.parse(s)
+    if not parsed_clc:
+        return s
+    
+    clc_codes = list(parsed_clc.values())[0]
+    if len(clc_codes) >= level:
+        clc_info = Parser.get_clc_info_by_code(clc_codes[level - 1])
+        if clc_info:
+            return clc_info["namePath"][level - 1]
+    elif 0 < len(clc_codes) < level:
+        return clc_codes[-1]
+    return None
+
+
+def _classify_chunk(codes):
+    return [Parser.classify(s) for s in codes]
+
+
+def main(argv=None):
+    """
+    命令行入口：从文件或标准输入读取中图分类号（每行一条），以JSON Lines格式输出解析结果。
+    
+    在源码目录下通过calibre自带的Python运行，例如：
+    calibre-debug -c "from src.clc_parser import main; main(['codes.txt', '-o', 'clc.jsonl'])"
+    """
+    parser = argparse.ArgumentParser(description='批量解析中图分类号，结果以JSON Lines格式输出。')
+    parser.add_argument('input', help='分类号列表文件，每行一条；“-”表示从标准输入读取')
+    parser.add_argument('-o', '--output', help='输出文件，默认为标准输出')
+    parser.add_argument('-p', '--processes', type=int, default=0, help='进程数，默认在当前进程中解析')
+    args = parser.parse_args(argv)
+
+    source = sys.stdin if args.input == '-' else open(args.input, encoding='utf-8')
+    output = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    try:
+        codes = (line.strip() for line in source if line.strip())
+        for s, path, name_path in Parser.parse_many(codes, processes=args.processes):
+            output.write(json.dumps({'input': s, 'path': path, 'namePath': name_path}, ensure_ascii=False) + '\n')
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+
+
 # 使用示例
 if __name__ == "__main__":
     test_codes = """
@@ -0,0 +1,72 @@
+'''
+CNMARC格式全记录的解析。
+
+OPAC的MARC显示格式（format=001）中，记录表格左列为字段号及指示符，如“200 1”；右列为以“|”引导的子字段，
+如“|a 深入理解计算机系统 |f (美) 兰德尔 E.布莱恩特著”。按字段号和子字段代码直接取值，不依赖中文标签和正则匹配。
+'''
+import re
+
+# 左列：字段号（三位数字或LDR、FMT等），其后可跟指示符
+MARC_TAG_PATTERN = re.compile(r'^(\d{3}|[A-Z]{3})\b')
+# 子字段：“|”后跟一位子字段代码
+SUBFIELD_PATTERN = re.compile(r'\|([0-9a-zA-Z])\s*')
+
+
+def split_subfields(text):
+    '''
+    拆分一个字段的子字段。
+    :param text: 右列文本，如“|a 北京 |c 机械工业出版社 |d 2016”。
+    :return: [[子字段代码, 内容], ...]；没有子字段的控制字段为 [['', 内容]]。
+    '''
+    parts = SUBFIELD_PATTERN.split(text)
+    if len(parts) == 1:
+        return [['', text.strip()]]
+    return [[code, value.strip()] for code, value in zip(parts[1::2], parts[2::2])]
+
+
+def parse_marc_rows(rows):
+    '''
+    将MARC格式全记录表格的行按字段号分组。左列为空的行是上一个字段的续行。
+    :param rows: parse_record_table 的解析结果。
+    :return: {字段号: [[[子字段代码, 内容], ...], ...]}，同一字段号可重复出现；
+             左列都不是字段号（如标准格式的中文标签）时返回None。
+    '''
+    lines = []
+    for td_elements in rows:
+        if len(td_elements) != 2:
+            continue
+        label = td_elements[0].replace('\xa0', ' ').strip()
+        text = td_elements[1].replace('\n', ' ').replace('\xa0', ' ')
+        if label:
+            match = MARC_TAG_PATTERN.match(label)
+            if not match:
+                continue
+            lines.append([match.group(1), text])
+        elif lines and text:
+            lines[-1][1] += '\n' + text
+    if not lines:
+        return None
+
+    fields = {}
+    for tag, text in lines:
+        fields.setdefault(tag, []).append(split_subfields(text))
+    return fields
+
+
+def subfield_values(fields, tag, codes):
+    '''
+    :param fields: parse_marc_rows 的解析结果。
+    :param tag: 字段号。
+    :param codes: 子字段代码，可为多个，如 'axyz'。
+    :return: 各次出现的该字段中，代码在 codes 中的子字段内容，按出现顺序排列。没有子字段代码的内容（如控制字段）不计入。
+    '''
+    codes = set(codes)
+    return [value for field in fields.get(tag, ()) for code, value in field if code in codes and value]
+
+
+def first_subfield(fields, tag, code, default=''):
+    '''
+    :return: 该字段第一次出现时第一个指定子字段的内容，没有时为 default。
+    '''
+    values = subfield_values(fields, tag, code)
+    return values[0] if values else default
@@ -0,0 +1,156 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Prometheus 指标名前缀
+PROMETHEUS_PREFIX = 'nlcisbn'
+
+
+class Metrics:
+    '''
+    查询流程各阶段的计时与计数。
+
+    计数器（请求数、字节数、缓存命中等）与阶段计时（会话、检索、下载、限速等待、解析、分类号解析等）
+    在插件进程内累计，所有线程共享，可随时取快照、写入日志或导出为JSON/Prometheus文本格式。
+    '''
+
+    # 单例模式
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.counters = {}
+        # 阶段 -> [次数, 总耗时, 最大耗时]
+        self.timers = {}
+        self.gauges = {}
+
+    @classmethod
+    def get_instance(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def add(self, name, value=1):
+        '''
+        累加计数器。
+        :param name: 计数器名称。
+        :param value: 增量。
+        '''
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set(self, name, value):
+        '''
+        设置瞬时值（如分类号解析缓存的命中数）。
+        '''
+        with self._lock:
+            self.gauges[name] = value
+
+    def observe(self, stage, seconds):
+        '''
+        记录一次阶段耗时。
+        :param stage: 阶段名称。
+        :param seconds: 耗时（单位：秒）。
+        '''
+        with self._lock:
+            timer = self.timers.get(stage)
+            if timer is None:
+                self.timers[stage] = [1, seconds, seconds]
+            else:
+                timer[0] += 1
+                timer[1] += seconds
+                if seconds > timer[2]:
+                    timer[2] = seconds
+
+    @contextmanager
+    def timer(self, stage):
+        '''
+        统计 with 语句块的耗时，语句块抛出异常时同样计入。
+        :param stage: 阶段名称。
+        '''
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def snapshot(self):
+        '''
+        :return: 当前所有指标的副本。
+        '''
+        with self._lock:
+            return {
+                'uptime': time.time() - self.started,
+                'counters': dict(self.counters),
+                'gauges': dict(self.gauges),
+                'timers': {stage: {'count': count, 'total': total, 'max': max_seconds}
+                           for stage, (count, total, max_seconds) in self.timers.items()},
+            }
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self.counters.clear()
+            self.timers.clear()
+            self.gauges.clear()
+
+    def summary(self):
+        '''
+        :return: 适合写入日志的多行文本。
+        '''
+        snapshot = self.snapshot()
+        lines = [f"查询统计（累计 {snapshot['uptime']:.0f} 秒）:"]
+        for stage, timer in sorted(snapshot['timers'].items(), key=lambda item: -item[1]['total']):
+            average = timer['total'] / timer['count'] * 1000
+            lines.append(f"  {stage:<12} {timer['count']:>6} 次  共 {timer['total']:8.3f} 秒  "
+                         f"平均 {average:8.1f} ms  最长 {timer['max'] * 1000:8.1f} ms")
+        values = {**snapshot['counters'], **snapshot['gauges']}
+        if values:
+            lines.append('  ' + '  '.join(f'{name}={value}' for name, value in sorted(values.items())))
+        return '\n'.join(lines)
+
+    def to_prometheus(self):
+        '''
+        :return: Prometheus 文本格式的指标。
+        '''
+        snapshot = self.snapshot()
+        lines = []
+        for name, value in sorted(snapshot['counters'].items()):
+            metric = f'{PROMETHEUS_PREFIX}_{name}_total'
+            lines += [f'# TYPE {metric} counter', f'{metric} {value}']
+        for name, value in sorted(snapshot['gauges'].items()):
+            metric = f'{PROMETHEUS_PREFIX}_{name}'
+            lines += [f'# TYPE {metric} gauge', f'{metric} {value}']
+        if snapshot['timers']:
+            metric = f'{PROMETHEUS_PREFIX}_stage_seconds'
+            lines.append(f'# TYPE {metric} summary')
+            for stage, timer in sorted(snapshot['timers'].items()):
+                lines.append(f'{metric}_sum{{stage="{stage}"}} {timer["total"]:.6f}')
+                lines.append(f'{metric}_count{{stage="{stage}"}} {timer["count"]}')
+            lines.append(f'# TYPE {metric}_max gauge')
+            for stage, timer in sorted(snapshot['timers'].items()):
+                lines.append(f'{metric}_max{{stage="{stage}"}} {timer["max"]:.6f}')
+        return '\n'.join(lines) + '\n'
+
+    def export(self, path):
+        '''
+        导出指标到文件。扩展名为 .prom 或 .txt 时使用Prometheus文本格式，否则为JSON。
+        先写入临时文件再替换，读取方不会读到写了一半的文件。
+        :param path: 文件路径。
+        '''
+        if os.path.splitext(path)[1].lower() in ('.prom', '.txt'):
+            content = self.to_prometheus()
+        else:
+            content = json.dumps(self.snapshot(), ensure_ascii=False, indent=2)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = f'{path}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(temp_path, path)
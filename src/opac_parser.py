@@ -0,0 +1,189 @@
+import re
+from html.parser import HTMLParser
+
+# 全记录页面中记录表格的起始标签：<table ... id="td">
+RECORD_TABLE_START_PATTERN = re.compile(r'<table\b[^>]*\bid\s*=\s*["\']?td\b', re.IGNORECASE)
+# 简要列表页面中第一个条目的起始标签：<div class="itemtitle">
+ITEMTITLE_START_PATTERN = re.compile(r'<div\b[^>]*\bclass\s*=\s*["\']?[^"\'>]*\bitemtitle\b', re.IGNORECASE)
+# 命中总数：全记录页面为“第 1 条记录(共 25 条)”，简要列表页面为“记录 1 - 10 (共 25 条)”
+TOTAL_HITS_PATTERNS = (
+    re.compile(r"第\s+\d+\s+条记录\(共\s+(\d+)\s+条\)"),
+    re.compile(r"记录\s*\d+\s*-\s*\d+\s*\(共\s*(\d+)\s*条\)"),
+)
+
+
+class _StopParsing(Exception):
+    '''
+    目标内容已读取完毕，提前结束解析。
+    '''
+
+
+class RecordTableParser(HTMLParser):
+    '''
+    全记录表格的流式解析器。
+
+    只解析 <table id="td"> 内的内容，逐行收集 class 含 td1 的单元格文本，表格结束后立即停止。
+    单元格文本的处理与 BeautifulSoup 的 get_text(strip=True) 一致：各文本片段去除首尾空白后直接拼接。
+    '''
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.found = False
+        self.rows = []
+        self._table_depth = 0
+        self._row = None
+        self._cell = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'table':
+            if self._table_depth == 0:
+                if dict(attrs).get('id') != 'td':
+                    return
+                self.found = True
+            self._table_depth += 1
+        elif not self._table_depth:
+            return
+        elif tag == 'tr':
+            self._close_row()
+            self._row = []
+        elif tag == 'td':
+            self._close_cell()
+            if 'td1' in (dict(attrs).get('class') or '').split():
+                if self._row is None:
+                    self._row = []
+                self._cell = []
+
+    def handle_endtag(self, tag):
+        if not self._table_depth:
+            return
+        if tag == 'td':
+            self._close_cell()
+        elif tag == 'tr':
+            self._close_row()
+        elif tag == 'table':
+            self._table_depth -= 1
+            if self._table_depth == 0:
+                self._close_row()
+                raise _StopParsing()
+
+    def handle_data(self, data):
+        if self._cell is not None:
+            data = data.strip()
+            if data:
+                self._cell.append(data)
+
+    def _close_cell(self):
+        if self._cell is not None:
+            self._row.append(''.join(self._cell))
+            self._cell = None
+
+    def _close_row(self):
+        self._close_cell()
+        if self._row is not None:
+            self.rows.append(self._row)
+            self._row = None
+
+
+def parse_record_table(html):
+    '''
+    解析全记录页面中的记录表格。
+
+    :param html: 全记录页面HTML。
+    :return: 各行 td1 单元格文本的列表，如 [['题名与责任', '...'], ...]；没有记录表格时返回None。
+    '''
+    match = RECORD_TABLE_START_PATTERN.search(html)
+    if not match:
+        return None
+
+    parser = RecordTableParser()
+    try:
+        # 从表格起始处开始解析，跳过页面头部
+        parser.feed(html[match.start():])
+        parser.close()
+    except _StopParsing:
+        pass
+    if not parser.found:
+        return None
+    parser._close_row()
+    return parser.rows
+
+
+class SearchListParser(HTMLParser):
+    '''
+    简要列表页面的流式解析器。
+
+    收集 class 含 itemtitle 的 <div> 的文本及其中第一个链接，收集到 limit 条后立即停止。
+    '''
+
+    def __init__(self, limit=None):
+        super().__init__(convert_charrefs=True)
+        self.limit = limit
+        self.items = []
+        self._div_depth = 0
+        self._text = None
+        self._link = None
+
+    def handle_starttag(self, tag, attrs):
+        if self._text is not None:
+            if tag == 'div':
+                self._div_depth += 1
+            elif tag == 'a' and self._link is None:
+                self._link = dict(attrs).get('href')
+        elif tag == 'div' and 'itemtitle' in (dict(attrs).get('class') or '').split():
+            self._div_depth = 1
+            self._text = []
+            self._link = None
+
+    def handle_endtag(self, tag):
+        if self._text is None or tag != 'div':
+            return
+        self._div_depth -= 1
+        if self._div_depth == 0:
+            if self._link:
+                self.items.append([''.join(self._text), self._link])
+            self._text = None
+            if self.limit is not None and len(self.items) >= self.limit:
+                raise _StopParsing()
+
+    def handle_data(self, data):
+        if self._text is not None:
+            self._text.append(data)
+
+
+def extract_total_hits(html):
+    '''
+    提取检索命中的记录总数。
+
+    :param html: 检索结果页面HTML。
+    :return: 命中总数，无法识别时返回None。
+    '''
+    for pattern in TOTAL_HITS_PATTERNS:
+        match = pattern.search(html)
+        if match:
+            return int(match.group(1))
+    return None
+
+
+def parse_search_page(html, limit=None):
+    '''
+    解析简要列表页面。
+
+    :param html: 简要列表页面HTML。
+    :param limit: 最多收集多少条，None表示不限制。
+    :return: ([[标题, 全记录链接], ...], 命中总数或None)
+    '''
+    total = extract_total_hits(html)
+    if limit is not None and limit <= 0:
+        return [], total
+
+    match = ITEMTITLE_START_PATTERN.search(html)
+    if not match:
+        return [], total
+
+    parser = SearchListParser(limit)
+    try:
+        parser.feed(html[match.start():])
+        parser.close()
+    except _StopParsing:
+        pass
+    return parser.items, total
@@ -0,0 +1,105 @@
+'''
+简要列表的相关度排序。
+
+根据简要列表中的题名与责任说明，计算每个条目与查询标题、作者的相似度，
+只下载得分最高的若干条全记录。中文按字切分，相似度使用字二元组（bigram）的Dice系数。
+'''
+import re
+
+# 简要列表条目得分达到该值视为与查询几乎一致
+NEAR_EXACT_SCORE = 0.9
+# 得分低于该值的条目不下载全记录
+MIN_RELEVANCE_SCORE = 0.3
+# 作者在得分中所占的权重
+AUTHOR_WEIGHT = 0.2
+
+# 文献类型标识，如 [专著]、[电子资源]
+MATERIAL_TYPE_PATTERN = re.compile(r'\[[^\]]*\]')
+NON_WORD_PATTERN = re.compile(r'[\W_]+')
+
+
+def normalize_text(text):
+    '''
+    标准化文本：转为小写，去除空白和标点。
+    :param text: 文本。
+    :return: 标准化后的文本。
+    '''
+    return NON_WORD_PATTERN.sub('', (text or '').lower())
+
+
+def split_brief_title(text):
+    '''
+    拆分简要列表中的题名与责任说明，如“凤凰架构 [专著] : 构建可靠的大型分布式系统 / 周志明著”。
+    :param text: 简要列表条目文本。
+    :return: (正题名, 含副题名的完整题名, 责任说明)
+    '''
+    title, _, responsibility = text.partition(' / ')
+    title = MATERIAL_TYPE_PATTERN.sub('', title)
+    main_title = re.split(r'\s[:=]\s', title, maxsplit=1)[0]
+    return main_title.strip(), title.strip(), responsibility.strip()
+
+
+def bigrams(text):
+    '''
+    :param text: 标准化后的文本。
+    :return: 字二元组集合，单字文本返回该字本身。
+    '''
+    if len(text) < 2:
+        return {text} if text else set()
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+def similarity(a, b):
+    '''
+    计算两个文本的相似度。
+    :param a: 文本a。
+    :param b: 文本b。
+    :return: 0~1之间的相似度，标准化后完全一致时为1。
+    '''
+    a, b = normalize_text(a), normalize_text(b)
+    if not a or not b:
+        return 0.0
+    if a == b:
+        return 1.0
+    grams_a, grams_b = bigrams(a), bigrams(b)
+    return 2 * len(grams_a & grams_b) / (len(grams_a) + len(grams_b))
+
+
+def score_entry(text, title, authors=None):
+    '''
+    计算简要列表条目与查询的相关度。
+    :param text: 简要列表条目文本。
+    :param title: 查询标题。
+    :param authors: 作者列表。
+    :return: 0~1之间的得分。
+    '''
+    main_title, full_title, responsibility = split_brief_title(text)
+    score = max(similarity(title, main_title), similarity(title, full_title))
+    names = [normalize_text(author) for author in (authors or [])]
+    names = [name for name in names if name]
+    if names:
+        matched = normalize_text(responsibility)
+        author_score = 1.0 if any(name in matched for name in names) else 0.0
+        score = (1 - AUTHOR_WEIGHT) * score + AUTHOR_WEIGHT * author_score
+    return score
+
+
+def rank_candidates(titlelist, title, authors=None, limit=None, min_score=MIN_RELEVANCE_SCORE, log=None):
+    '''
+    按相关度对简要列表排序。
+    :param titlelist: parse_search_list 返回的 [[标题, 全记录链接], ...]。
+    :param title: 查询标题。
+    :param authors: 作者列表。
+    :param limit: 最多保留多少条。
+    :param min_score: 低于该得分的条目被丢弃；没有条目达到该得分时（如标题过短、音译等），不丢弃任何条目。
+    :param log: 可选的日志记录器。
+    :return: 按得分从高到低排列的 [(得分, 标题, 全记录链接), ...]，得分相同时保持原顺序。
+    '''
+    ranked = [(score_entry(text, title, authors), text, url) for text, url in titlelist]
+    ranked.sort(key=lambda item: -item[0])
+    relevant = [item for item in ranked if item[0] >= min_score]
+    if relevant:
+        ranked = relevant
+    elif ranked and log is not None:
+        log.info(f"没有条目的相关度达到 {min_score}，按得分保留前 {limit or len(ranked)} 条")
+    return ranked[:limit] if limit else ranked
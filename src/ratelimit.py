@@ -0,0 +1,112 @@
+import threading
+import time
+
+
+class RateLimiter:
+    '''
+    全局令牌桶限速器，带AIMD自适应调节。
+
+    所有线程共享同一个限速器，发往OPAC的请求总速率不超过当前速率（次/秒）。
+    请求出现超时、5xx或拦截页面时速率减半（乘性减小），连续成功若干次后速率小幅上调（加性增大），
+    直到 max_rate 为止，从而在服务器可承受的范围内获得最高吞吐量。
+    rate 为0时不限速。
+    '''
+
+    # 单例模式
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, rate=1.0, max_rate=None, min_rate=0.1, burst=1,
+                 increase_step=0.1, decrease_factor=0.5, success_threshold=10):
+        '''
+        :param rate: 初始速率（次/秒），0表示不限速。
+        :param max_rate: 自适应调节的速率上限，默认等于初始速率。
+        :param min_rate: 自适应调节的速率下限。
+        :param burst: 令牌桶容量，即允许的突发请求数。
+        :param increase_step: 每次上调的速率（次/秒）。
+        :param decrease_factor: 失败时速率乘以该系数。
+        :param success_threshold: 连续成功多少次后上调速率。
+        '''
+        self.rate = rate
+        self.base_rate = rate
+        self.max_rate = max_rate if max_rate is not None else rate
+        self.min_rate = min_rate
+        self.burst = burst
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.success_threshold = success_threshold
+
+        self._tokens = burst
+        self._last_time = time.monotonic()
+        self._successes = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def configure(self, rate=None, max_rate=None):
+        '''
+        更新速率设置，未传入的参数保持不变。
+        :param rate: 初始速率（次/秒），0表示不限速。
+        :param max_rate: 自适应调节的速率上限。
+        '''
+        with self._lock:
+            if max_rate is not None:
+                self.max_rate = max_rate
+            # 初始速率未变化时，保留自适应调节后的当前速率
+            if rate is not None and rate != self.base_rate:
+                self.base_rate = rate
+                self.rate = rate
+            self.max_rate = max(self.max_rate, self.base_rate)
+            if self.rate > self.max_rate:
+                self.rate = self.max_rate
+
+    def reserve(self):
+        '''
+        预约一个令牌。
+        :return: 需要等待的时间（单位：秒），等待结束后即可发出请求。
+        '''
+        with self._lock:
+            if self.rate <= 0:
+                return 0
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last_time) * self.rate)
+            self._last_time = now
+            # 允许令牌为负，相当于预约了未来的令牌，各线程按预约顺序依次放行
+            self._tokens -= 1
+            return -self._tokens / self.rate if self._tokens < 0 else 0
+
+    def acquire(self):
+        '''
+        取得一个令牌，令牌不足时等待。
+        '''
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    def on_success(self):
+        '''
+        记录一次成功的请求，连续成功达到阈值后加性上调速率。
+        '''
+        with self._lock:
+            self._successes += 1
+            if self._successes >= self.success_threshold and 0 < self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.increase_step)
+                self._successes = 0
+
+    def on_failure(self):
+        '''
+        记录一次失败的请求（超时、5xx、拦截页面等），乘性降低速率。
+        :return: 调整后的速率。
+        '''
+        with self._lock:
+            self._successes = 0
+            if self.rate > 0:
+                self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+                # 清空已积攒的令牌，立即按新速率执行
+                self._tokens = min(self._tokens, 0)
+            return self.rate
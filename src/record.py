@@ -0,0 +1,299 @@
+'''
+国家图书馆全记录的结构化模型。
+
+NLCRecord 只保存全记录表格中的原始字段，标题、作者、出版年等派生字段在首次访问时计算并缓存。
+原始字段可以序列化后缓存，选项改变时直接重新派生，无需再次下载页面。
+MARCRecord 保存MARC格式全记录的字段，按字段号和子字段代码派生相同的元数据。
+'''
+import re
+
+from .clc_parser import Parser
+from .marc_parser import subfield_values, first_subfield
+from .metrics import Metrics
+
+# 去掉标题中“[专著]”等文献类型标识及其后的副题名、责任说明
+TITLE_STRIP_PATTERN = re.compile(r"([\u4e00-\u9fa5a-zA-Z0-9]+(?:[\u4e00-\u9fa5a-zA-Z0-9\s]+)?)(?=\s\[[\u4e00-\u9fa5]{2}\])")
+# 去掉作者后的“著”“编”等责任方式
+AUTHOR_STRIP_PATTERN = re.compile(r'^(.*?)\s+(?:著|编)')
+# “通用数据”第10-13位为出版年份
+YEAR_PATTERN = re.compile(r'\b(\d{4})\b')
+PUBLISHER_PATTERN = re.compile(r':\s*(.+),\s')
+TAG_SPLIT_PATTERN = re.compile(r'[&\s]+')
+
+# 尚未计算的派生字段
+_UNSET = object()
+
+
+def general_data_year(general_data):
+    '''
+    :param general_data: 通用数据（CNMARC 100$a），如“20170111d2016    em y0chiy50      ea”。
+    :return: 第9-12位的出版年份，不是年份时为空字符串。
+    '''
+    year = general_data.strip()[9:13]
+    return year if year.isdigit() and len(year) == 4 else ''
+
+
+class NLCRecord:
+    '''
+    一条全记录。
+
+    fields 为“字段名→内容”的字典，字段名即全记录表格左列的中文标签，如“题名与责任”“著者”“出版项”。
+    '''
+
+    __slots__ = ('fields', 'query_isbn', 'isbn',
+                 '_title', '_short_title', '_authors', '_short_authors', '_year', '_publisher', '_subjects')
+
+    def __init__(self, fields, query_isbn=None, isbn=''):
+        '''
+        :param fields: 原始字段字典。
+        :param query_isbn: 查询时使用的ISBN，记录中没有题名时作为标题。
+        :param isbn: 从页面中解析出的ISBN。
+        '''
+        self.fields = fields
+        self.query_isbn = query_isbn
+        self.isbn = isbn
+        self._title = self._short_title = self._authors = self._short_authors = _UNSET
+        self._year = self._publisher = self._subjects = _UNSET
+
+    @classmethod
+    def from_rows(cls, rows, query_isbn=None, isbn=''):
+        '''
+        由全记录表格的行构建记录。左列为空的行是上一个字段的续行。
+        :param rows: parse_record_table 的解析结果。
+        :param query_isbn: 查询时使用的ISBN。
+        :param isbn: 从页面中解析出的ISBN。
+        :return: NLCRecord 对象。
+        '''
+        fields = {}
+        prev_td1 = ''
+        prev_td2 = ''
+        for td_elements in rows:
+            if len(td_elements) != 2:
+                continue
+            td1 = td_elements[0].replace('\n', '').replace('\xa0', ' ')
+            td2 = td_elements[1].replace('\n', '').replace('\xa0', ' ')
+            if td1 == '' and td2 == '':
+                continue
+            if td1:
+                fields[td1] = td2.strip()
+            else:
+                fields[prev_td1] = '\n'.join([prev_td2, td2]).strip()
+            prev_td1 = td1.strip()
+            prev_td2 = td2.strip()
+        return cls(fields, query_isbn, isbn)
+
+    @classmethod
+    def from_json(cls, data):
+        '''
+        :param data: to_json 的结果。
+        :return: NLCRecord 对象，格式不符时为None。
+        '''
+        if not isinstance(data, dict) or 'fields' not in data:
+            return None
+        if data.get('format') == MARCRecord.FORMAT:
+            cls = MARCRecord
+        return cls(data['fields'], data.get('query_isbn'), data.get('isbn', ''))
+
+    def to_json(self):
+        '''
+        :return: 可JSON序列化的原始记录。
+        '''
+        return {'fields': self.fields, 'query_isbn': self.query_isbn, 'isbn': self.isbn}
+
+    @property
+    def title(self):
+        '''完整的题名与责任说明。'''
+        if self._title is _UNSET:
+            self._title = self.fields.get("题名与责任", f"{self.query_isbn}")
+        return self._title
+
+    @property
+    def short_title(self):
+        '''去掉文献类型标识、副题名和责任说明后的标题。'''
+        if self._short_title is _UNSET:
+            match = TITLE_STRIP_PATTERN.search(self.title)
+            self._short_title = match.group(1) if match else self.title
+        return self._short_title
+
+    @property
+    def authors(self):
+        '''“著者”字段中的作者，含责任方式。'''
+        if self._authors is _UNSET:
+            self._authors = self.fields.get("著者", "").split(' & ')
+        return self._authors
+
+    @property
+    def short_authors(self):
+        '''去掉责任方式后的作者，无法识别责任方式的条目被丢弃。'''
+        if self._short_authors is _UNSET:
+            self._short_authors = [match.group(1) for match in map(AUTHOR_STRIP_PATTERN.match, self.authors) if match]
+        return self._short_authors
+
+    @property
+    def year(self):
+        '''出版年份，优先从“通用数据”提取，其次从“出版项”提取。'''
+        if self._year is _UNSET:
+            year = general_data_year(self.fields.get("通用数据", ""))
+            if not year:
+                match = YEAR_PATTERN.search(self.fields.get("出版项", ""))
+                year = match.group(1) if match else ''
+            self._year = year
+        return self._year
+
+    @property
+    def publisher(self):
+        if self._publisher is _UNSET:
+            match = PUBLISHER_PATTERN.search(self.fields.get("出版项", ""))
+            self._publisher = match.group(1) if match else ""
+        return self._publisher
+
+    @property
+    def subjects(self):
+        '''“主题”字段，主题词之间以“&”分隔。'''
+        if self._subjects is _UNSET:
+            self._subjects = self.fields.get("主题", "").replace('--', '&')
+        return self._subjects
+
+    @property
+    def clc_code(self):
+        return self.fields.get("中图分类号", "")
+
+    @property
+    def comments(self):
+        return self.fields.get("内容提要", "")
+
+    def tags(self, purse_tag=False, add_clc=True, convert_clc=True, clc_level=2):
+        '''
+        :param purse_tag: 是否只使用主题词作为标签。
+        :param add_clc: 是否将中图分类号加入标签。
+        :param convert_clc: 是否将中图分类号转换为分类名称。
+        :param clc_level: 分类名称的解析层级。
+        :return: 标签列表。
+        '''
+        tags = self.subjects
+        if not purse_tag:
+            tags += f' & {self.publisher}'
+            if self.year:
+                tags += f' & {self.year}'
+            if add_clc:
+                if convert_clc:
+                    # 使用 Parser 解析中图分类号（结果已缓存）
+                    with Metrics.get_instance().timer('clc'):
+                        clc_tag = Parser.resolve_tag(self.clc_code, clc_level)
+                    if clc_tag:
+                        tags += f' & {clc_tag}'
+                else:
+                    tags += f' & {self.clc_code}'
+        return [tag.strip() for tag in TAG_SPLIT_PATTERN.split(tags) if tag.strip()]
+
+    def to_dict(self, strip_title=True, strip_author=True, purse_tag=False, add_clc=True, convert_clc=True, clc_level=2):
+        '''
+        按选项派生元数据字典，格式与 to_metadata 的输入一致。
+        :return: 元数据字典。
+        '''
+        return {
+            "title": self.short_title if strip_title else self.title,
+            "tags": self.tags(purse_tag, add_clc, convert_clc, clc_level),
+            "comments": self.comments,
+            'publisher': self.publisher,
+            'pubdate': self.year,
+            'authors': self.short_authors if strip_author else self.authors,
+            "isbn": self.isbn
+        }
+
+
+class MARCRecord(NLCRecord):
+    '''
+    一条MARC格式的全记录。
+
+    fields 为 parse_marc_rows 的解析结果，即“字段号→各次出现的子字段列表”，如
+    {'200': [[['a', '深入理解计算机系统'], ['b', '专著'], ...]], '210': [...]}。
+    '''
+
+    __slots__ = ()
+
+    # 缓存中标识记录格式
+    FORMAT = 'marc'
+
+    def to_json(self):
+        data = super().to_json()
+        data['format'] = self.FORMAT
+        return data
+
+    def is_valid(self):
+        '''
+        :return: 是否含有正题名（200$a）。
+        '''
+        return bool(first_subfield(self.fields, '200', 'a'))
+
+    @property
+    def marc_isbn(self):
+        '''010$a 中的ISBN，只保留数字和X。'''
+        return ''.join(c for c in first_subfield(self.fields, '010', 'a') if c in '0123456789Xx').upper()
+
+    @property
+    def title(self):
+        '''按标准格式的“题名与责任”拼接：正题名 [文献类型] = 并列题名 : 副题名 / 第一责任 ; 其他责任。'''
+        if self._title is _UNSET:
+            title = self.short_title
+            if title:
+                title += ''.join(f' [{value}]' for value in subfield_values(self.fields, '200', 'b'))
+                title += ''.join(f' = {value}' for value in subfield_values(self.fields, '200', 'd'))
+                title += ''.join(f' : {value}' for value in subfield_values(self.fields, '200', 'e'))
+                title += ''.join(f' / {value}' for value in subfield_values(self.fields, '200', 'f')[:1])
+                title += ''.join(f' ; {value}' for value in subfield_values(self.fields, '200', 'fg')[1:])
+            self._title = title or f"{self.query_isbn}"
+        return self._title
+
+    @property
+    def short_title(self):
+        '''正题名（200$a），合订题名以“. ”连接。'''
+        if self._short_title is _UNSET:
+            self._short_title = '. '.join(subfield_values(self.fields, '200', 'a')) or f"{self.query_isbn}"
+        return self._short_title
+
+    @property
+    def authors(self):
+        '''主要责任者（700、701、710、711），名称后接责任方式（$4），与标准格式的“著者”一致。'''
+        if self._authors is _UNSET:
+            authors = []
+            for tag in ('700', '701', '710', '711'):
+                for field in self.fields.get(tag, ()):
+                    name = ' '.join(value for code, value in field if code in 'ab' and value)
+                    relator = ' '.join(value for code, value in field if code == '4' and value)
+                    if name:
+                        authors.append(f'{name} {relator}' if relator else name)
+            self._authors = authors
+        return self._authors
+
+    @property
+    def year(self):
+        '''出版年份，优先取通用数据（100$a）第9-12位，其次从出版时间（210$d）提取。'''
+        if self._year is _UNSET:
+            year = general_data_year(first_subfield(self.fields, '100', 'a'))
+            if not year:
+                match = YEAR_PATTERN.search(first_subfield(self.fields, '210', 'd'))
+                year = match.group(1) if match else ''
+            self._year = year
+        return self._year
+
+    @property
+    def publisher(self):
+        if self._publisher is _UNSET:
+            self._publisher = first_subfield(self.fields, '210', 'c')
+        return self._publisher
+
+    @property
+    def subjects(self):
+        '''普通主题（606）的主题词及各复分，以“&”分隔。'''
+        if self._subjects is _UNSET:
+            self._subjects = ' & '.join(subfield_values(self.fields, '606', 'ajxyz'))
+        return self._subjects
+
+    @property
+    def clc_code(self):
+        return first_subfield(self.fields, '690', 'a')
+
+    @property
+    def comments(self):
+        return '\n'.join(subfield_values(self.fields, '330', 'a'))
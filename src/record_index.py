@@ -0,0 +1,199 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from .ranking import normalize_text, bigrams, score_entry, NEAR_EXACT_SCORE
+
+# 全文检索时最多取出多少条候选记录，再逐条计算相关度
+MAX_INDEX_CANDIDATES = 50
+
+
+def gram_text(text):
+    '''
+    将文本切分为字二元组，以空格连接后交给FTS5的 unicode61 分词器，使中文按二元组而不是整句建立索引。
+    :param text: 原始文本。
+    :return: 空格分隔的二元组。
+    '''
+    return ' '.join(sorted(bigrams(normalize_text(text))))
+
+
+def gram_query(text):
+    '''
+    :param text: 查询文本。
+    :return: 匹配任一二元组的FTS5查询表达式，没有可检索的字符时为空字符串。
+    '''
+    return ' OR '.join(f'"{gram}"' for gram in sorted(bigrams(normalize_text(text))))
+
+
+class RecordIndex:
+    '''
+    本地全记录索引。
+
+    每条解析得到的全记录都以 NLCRecord.to_json 的形式存入SQLite，题名与作者按字二元组写入FTS5全文索引。
+    按标题检索时先查询本地索引，用与简要列表相同的相关度算法（ranking.score_entry）给候选记录打分，
+    有与标题几乎一致的记录时直接返回，不再访问国家图书馆。
+    '''
+
+    # 单例模式，按数据库路径区分
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    # 当前启用的索引
+    _active = None
+
+    def __init__(self, path, ttl=30 * 86400, max_entries=50000):
+        '''
+        :param path: SQLite数据库文件路径。
+        :param ttl: 记录的有效期（单位：秒），过期的记录不再作为检索结果。
+        :param max_entries: 最多保存多少条记录，超出后淘汰最早写入的记录。
+        '''
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS records ('
+            'id INTEGER PRIMARY KEY, '
+            'key TEXT UNIQUE NOT NULL, '
+            'isbn TEXT, '
+            'title TEXT NOT NULL, '
+            'publisher TEXT, '
+            'clc TEXT, '
+            'data TEXT NOT NULL, '
+            'indexed REAL NOT NULL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS records_isbn ON records (isbn)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS records_indexed ON records (indexed)')
+        # 不支持FTS5的SQLite在此抛出 sqlite3.OperationalError
+        self._conn.execute('CREATE VIRTUAL TABLE IF NOT EXISTS records_fts USING fts5(title, authors)')
+        self._conn.commit()
+
+    @classmethod
+    def get_instance(cls, path):
+        with cls._instances_lock:
+            instance = cls._instances.get(path)
+            if instance is None:
+                instance = cls._instances[path] = cls(path)
+            return instance
+
+    @classmethod
+    def activate(cls, path):
+        '''
+        启用索引，此后解析得到的全记录都会写入该索引。
+        :param path: 索引文件路径。
+        '''
+        index = cls.get_instance(path)
+        with cls._instances_lock:
+            cls._active = index
+        return index
+
+    @classmethod
+    def deactivate(cls):
+        with cls._instances_lock:
+            cls._active = None
+
+    @classmethod
+    def active(cls):
+        '''
+        :return: 当前启用的索引或None。
+        '''
+        with cls._instances_lock:
+            return cls._active
+
+    def configure(self, ttl=None, max_entries=None):
+        '''
+        更新索引参数，未传入的参数保持不变。
+        '''
+        if ttl is not None:
+            self.ttl = ttl
+        if max_entries is not None:
+            self.max_entries = max_entries
+
+    def add(self, record):
+        '''
+        写入一条全记录，同一ISBN、同一正题名的记录已存在时覆盖。
+        :param record: NLCRecord 对象。
+        :return: 是否写入。没有题名的记录不写入。
+        '''
+        title = record.title
+        if not normalize_text(record.short_title) or title == f"{record.query_isbn}":
+            return False
+        # 同一本书可能先后以标准格式和MARC格式解析，题名的标点略有不同，按ISBN与标准化后的正题名去重
+        key = f'{record.isbn}\x1f{normalize_text(record.short_title if record.isbn else title)}'
+        data = json.dumps(record.to_json(), ensure_ascii=False)
+        with self._lock:
+            row = self._conn.execute('SELECT id FROM records WHERE key = ?', (key,)).fetchone()
+            if row is not None:
+                self._conn.execute('DELETE FROM records_fts WHERE rowid = ?', (row[0],))
+            cursor = self._conn.execute(
+                'INSERT OR REPLACE INTO records (id, key, isbn, title, publisher, clc, data, indexed) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (row[0] if row else None, key, record.isbn, title, record.publisher, record.clc_code, data, time.time())
+            )
+            self._conn.execute(
+                'INSERT INTO records_fts (rowid, title, authors) VALUES (?, ?, ?)',
+                (cursor.lastrowid, gram_text(title), gram_text(' '.join(record.authors)))
+            )
+            self._evict()
+            self._conn.commit()
+        return True
+
+    def _evict(self):
+        '''
+        超出容量上限时，淘汰最早写入的记录。调用方需持有锁。
+        '''
+        if self.max_entries <= 0:
+            return
+        count = self._conn.execute('SELECT COUNT(*) FROM records').fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            ids = [row[0] for row in self._conn.execute(
+                'SELECT id FROM records ORDER BY indexed LIMIT ?', (overflow,))]
+            self._conn.executemany('DELETE FROM records_fts WHERE rowid = ?', [(i,) for i in ids])
+            self._conn.executemany('DELETE FROM records WHERE id = ?', [(i,) for i in ids])
+
+    def search(self, title, authors=None, limit=None, min_score=NEAR_EXACT_SCORE):
+        '''
+        按标题检索本地记录。
+        :param title: 查询标题。
+        :param authors: 作者列表，只用于排序。
+        :param limit: 最多返回多少条。
+        :param min_score: 题名得分低于该值的记录被丢弃，默认只返回与标题几乎一致的记录。
+               作者写法不同（如拼音、译者在前）时合并得分偏低，因此不按合并得分筛选。
+        :return: 按合并得分从高到低排列的 [(得分, NLCRecord.to_json 的结果), ...]。
+        '''
+        query = gram_query(title)
+        if not query:
+            return []
+        expired = time.time() - self.ttl
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT records.title, records.data FROM records_fts '
+                'JOIN records ON records.id = records_fts.rowid '
+                'WHERE records_fts MATCH ? AND records.indexed >= ? '
+                'ORDER BY records_fts.rank LIMIT ?',
+                ('{title} : (' + query + ')', expired, MAX_INDEX_CANDIDATES)
+            ).fetchall()
+        ranked = [(score_entry(text, title, authors), json.loads(data)) for text, data in rows
+                  if score_entry(text, title) >= min_score]
+        ranked.sort(key=lambda item: -item[0])
+        return ranked[:limit] if limit else ranked
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM records').fetchone()[0]
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute('DELETE FROM records_fts')
+            self._conn.execute('DELETE FROM records')
+            self._conn.commit()
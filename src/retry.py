@@ -0,0 +1,177 @@
+import asyncio
+import http.client
+import random
+import socket
+import threading
+import time
+import urllib.error
+
+# 错误分类
+TRANSIENT = 'transient'
+PERMANENT = 'permanent'
+
+# 熔断器状态
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class OPACBlockedError(urllib.error.URLError):
+    '''
+    OPAC返回了访问频率过高的拦截页面。
+    '''
+
+
+class CircuitOpenError(urllib.error.URLError):
+    '''
+    熔断器处于断开状态，请求未发出即失败。
+    '''
+
+
+def classify_error(error):
+    '''
+    判断请求错误是否值得重试。
+    :param error: 异常对象。
+    :return: TRANSIENT（超时、连接失败、5xx、429、拦截页面）或 PERMANENT（其余错误，如404）。
+    '''
+    if isinstance(error, CircuitOpenError):
+        return PERMANENT
+    if isinstance(error, urllib.error.HTTPError):
+        return TRANSIENT if error.code >= 500 or error.code == 429 else PERMANENT
+    # Python 3.11 之前 asyncio.TimeoutError 不是 TimeoutError 的子类
+    if isinstance(error, (OSError, http.client.HTTPException, TimeoutError, socket.timeout, asyncio.TimeoutError)):
+        return TRANSIENT
+    return PERMANENT
+
+
+class RetryPolicy:
+    '''
+    有上限的重试策略，重试间隔按指数退避并加入随机抖动（full jitter），避免多个线程同时重试。
+    '''
+
+    # 单例模式
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, max_retries=2, base_delay=1.0, max_delay=30.0):
+        '''
+        :param max_retries: 首次请求失败后最多重试几次。
+        :param base_delay: 第一次重试的最长等待时间（单位：秒），之后每次翻倍。
+        :param max_delay: 单次等待时间的上限（单位：秒）。
+        '''
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    @classmethod
+    def get_instance(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def configure(self, max_retries=None, base_delay=None, max_delay=None):
+        '''
+        更新重试参数，未传入的参数保持不变。
+        '''
+        if max_retries is not None:
+            self.max_retries = max(0, int(max_retries))
+        if base_delay is not None:
+            self.base_delay = base_delay
+        if max_delay is not None:
+            self.max_delay = max_delay
+
+    def backoff(self, attempt):
+        '''
+        :param attempt: 已失败的次数减一（第一次重试前为0）。
+        :return: 本次重试前的等待时间（单位：秒）。
+        '''
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+class CircuitBreaker:
+    '''
+    熔断器。
+
+    连续出现 failure_threshold 次可重试的错误后断开，冷却期内的请求立即以 CircuitOpenError 失败，不再等待超时；
+    冷却期结束后进入半开状态，只放行一个试探请求，成功则恢复，失败则重新断开。
+    '''
+
+    # 单例模式
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, failure_threshold=5, cooldown=60.0):
+        '''
+        :param failure_threshold: 连续失败多少次后断开，0表示不启用熔断。
+        :param cooldown: 断开后的冷却时间（单位：秒）。
+        '''
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def configure(self, failure_threshold=None, cooldown=None):
+        '''
+        更新熔断参数，未传入的参数保持不变。
+        '''
+        with self._lock:
+            if failure_threshold is not None:
+                self.failure_threshold = max(0, int(failure_threshold))
+            if cooldown is not None:
+                self.cooldown = cooldown
+
+    def before_call(self, log=None):
+        '''
+        发出请求前调用。
+        :param log: 日志记录器，状态变化时写入日志。
+        :raise CircuitOpenError: 熔断器断开，或半开状态下已有试探请求在进行。
+        '''
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            if self.state == OPEN:
+                remaining = self._opened_at + self.cooldown - time.monotonic()
+                if remaining > 0:
+                    raise CircuitOpenError(f"国家图书馆暂时无法访问，{remaining:.0f} 秒后重试")
+                self.state = HALF_OPEN
+                self._probing = False
+                if log is not None:
+                    log.info("熔断器进入半开状态，发送试探请求")
+            if self._probing:
+                raise CircuitOpenError("国家图书馆暂时无法访问，正在等待试探请求的结果")
+            self._probing = True
+
+    def record_success(self, log=None):
+        with self._lock:
+            self._failures = 0
+            self._probing = False
+            if self.state != CLOSED:
+                self.state = CLOSED
+                if log is not None:
+                    log.info("熔断器已闭合，恢复正常请求")
+
+    def record_failure(self, log=None):
+        '''
+        记录一次可重试的错误。
+        :return: 熔断器是否处于断开状态。
+        '''
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self.state == HALF_OPEN or (self.state == CLOSED and 0 < self.failure_threshold <= self._failures):
+                self.state = OPEN
+                self._opened_at = time.monotonic()
+                if log is not None:
+                    log.error(f"连续失败 {self._failures} 次，熔断器断开，{self.cooldown:.0f} 秒内的请求将直接失败")
+            return self.state == OPEN
@@ -0,0 +1,211 @@
+import http.client
+import http.cookiejar
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+import zlib
+
+from .metrics import Metrics
+
+# 跟随重定向的最大次数
+MAX_REDIRECTS = 5
+REDIRECT_STATUS = (301, 302, 303, 307, 308)
+
+
+def resolve_route(url):
+    '''
+    计算请求实际连接的地址与请求路径，支持系统HTTP代理。
+    :param url: 请求URL。
+    :return: ((协议, 主机, 端口), 请求路径)
+    '''
+    parts = urllib.parse.urlsplit(url)
+    proxy = urllib.request.getproxies().get(parts.scheme) if not urllib.request.proxy_bypass(parts.hostname) else None
+    if proxy and parts.scheme == 'http':
+        proxy_parts = urllib.parse.urlsplit(proxy if '://' in proxy else 'http://' + proxy)
+        return ('http', proxy_parts.hostname, proxy_parts.port or 80), url
+    path = parts.path or '/'
+    if parts.query:
+        path += '?' + parts.query
+    default_port = 443 if parts.scheme == 'https' else 80
+    return (parts.scheme, parts.hostname, parts.port or default_port), path
+
+
+def decode_body(headers, body):
+    '''
+    按 Content-Encoding 解压响应体。
+    :param headers: 响应头。
+    :param body: 原始响应体。
+    :return: 解压后的响应体。
+    :raise urllib.error.URLError: 解压失败或内容编码不受支持。
+    '''
+    encoding = (headers.get('Content-Encoding') or '').strip().lower()
+    if not body or encoding in ('', 'identity'):
+        return body
+    try:
+        if encoding in ('gzip', 'x-gzip'):
+            return zlib.decompress(body, 16 + zlib.MAX_WBITS)
+        if encoding == 'deflate':
+            try:
+                return zlib.decompress(body)
+            except zlib.error:
+                # 部分服务器发送不带zlib头的原始deflate数据
+                return zlib.decompress(body, -zlib.MAX_WBITS)
+    except zlib.error as e:
+        raise urllib.error.URLError(f"解压响应失败（{encoding}）: {e}")
+    raise urllib.error.URLError(f"不支持的内容编码: {encoding}")
+
+
+def count_bytes(wire_size, decoded_size):
+    '''
+    记录传输的字节数（压缩后）与解压后的字节数。
+    '''
+    metrics = Metrics.get_instance()
+    metrics.add('bytes', wire_size)
+    metrics.add('bytes_decoded', decoded_size)
+
+
+class HTTPTransport:
+    '''
+    带连接池的HTTP传输层。
+
+    对同一主机复用 HTTP/1.1 长连接，所有线程共享同一个连接池和 Cookie（OPAC会话），
+    同时活动的连接数不超过 pool_size（与最大线程数一致）。响应按 Content-Encoding 自动解压。
+    '''
+
+    # 单例模式
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, headers=None, pool_size=2, timeout=10):
+        '''
+        :param headers: 每个请求附带的默认请求头。
+        :param pool_size: 最多同时活动的连接数。
+        :param timeout: 连接与读取超时（单位：秒）。
+        '''
+        self.headers = {k: v for k, v in (headers or {}).items()
+                        if k.lower() not in ('host', 'proxy-connection', 'connection')}
+        self.headers['Connection'] = 'keep-alive'
+        self.timeout = timeout
+        self.cookie_jar = http.cookiejar.CookieJar()
+
+        self._pool_size = max(1, int(pool_size))
+        self._active = 0
+        self._idle = {}
+        self._cond = threading.Condition()
+
+    @classmethod
+    def get_instance(cls, headers=None):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls(headers)
+            return cls._instance
+
+    def resize(self, pool_size):
+        '''
+        调整连接池大小。
+        :param pool_size: 最多同时活动的连接数。
+        '''
+        with self._cond:
+            self._pool_size = max(1, int(pool_size))
+            for connections in self._idle.values():
+                while len(connections) > self._pool_size:
+                    connections.pop(0).close()
+            self._cond.notify_all()
+
+    def close(self):
+        '''
+        关闭所有空闲连接。
+        '''
+        with self._cond:
+            for connections in self._idle.values():
+                for conn in connections:
+                    conn.close()
+            self._idle.clear()
+
+    def _acquire(self, key):
+        with self._cond:
+            while self._active >= self._pool_size:
+                self._cond.wait()
+            self._active += 1
+            connections = self._idle.get(key)
+            if connections:
+                return connections.pop(), True
+        return self._new_connection(key), False
+
+    def _release(self, key, conn, reusable):
+        with self._cond:
+            self._active -= 1
+            connections = self._idle.setdefault(key, [])
+            if reusable and len(connections) < self._pool_size:
+                connections.append(conn)
+            else:
+                conn.close()
+            self._cond.notify()
+
+    def _new_connection(self, key):
+        scheme, host, port = key
+        connection_class = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+        return connection_class(host, port, timeout=self.timeout)
+
+    def _send(self, url, headers):
+        '''
+        发送一次GET请求并读取完整响应。复用的长连接已被服务器关闭时，自动换新连接重试一次。
+        :return: (状态码, 原因, 响应头, 响应体)
+        '''
+        key, path = resolve_route(url)
+        request = urllib.request.Request(url, headers=headers)
+        self.cookie_jar.add_cookie_header(request)
+        request_headers = dict(request.header_items())
+
+        while True:
+            conn, reused = self._acquire(key)
+            try:
+                conn.request('GET', path, headers=request_headers)
+                response = conn.getresponse()
+                body = response.read()
+            except (http.client.HTTPException, ConnectionError) as e:
+                self._release(key, conn, False)
+                if reused:
+                    Metrics.get_instance().add('connection_retries')
+                    continue
+                raise urllib.error.URLError(e)
+            except BaseException:
+                self._release(key, conn, False)
+                raise
+            self._release(key, conn, not response.will_close)
+            self.cookie_jar.extract_cookies(response, request)
+            return response.status, response.reason, response.msg, body
+
+    def get(self, url, headers=None):
+        '''
+        下载页面，自动跟随重定向。
+        :param url: 页面URL。
+        :param headers: 额外的请求头。
+        :return: (最终URL, 响应头, 解压后的响应体)
+        '''
+        request_headers = dict(self.headers)
+        if headers:
+            request_headers.update(headers)
+
+        for _ in range(MAX_REDIRECTS + 1):
+            status, reason, response_headers, body = self._send(url, request_headers)
+            if status in REDIRECT_STATUS and response_headers.get('Location'):
+                url = urllib.parse.urljoin(url, response_headers['Location'])
+                continue
+            if status >= 400:
+                raise urllib.error.HTTPError(url, status, reason, response_headers, None)
+            decoded = decode_body(response_headers, body)
+            count_bytes(len(body), len(decoded))
+            return url, response_headers, decoded
+        raise urllib.error.URLError(f"重定向次数过多: {url}")
+
+    def get_text(self, url, encoding='utf-8'):
+        '''
+        下载页面并解码为文本。
+        :param url: 页面URL。
+        :param encoding: 页面编码。
+        :return: 页面文本。
+        '''
+        _, _, body = self.get(url)
+        return body.decode(encoding)
@@ -0,0 +1,43 @@
+import importlib.util
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, 'src')
+FIXTURES = os.path.join(ROOT, 'benchmarks', 'fixtures')
+EXPECTED = os.path.join(ROOT, 'tests', 'expected')
+
+
+class QuietLog:
+    '''
+    丢弃所有日志。
+    '''
+
+    def __getattr__(self, name):
+        return self
+
+    def __call__(self, *args, **kwargs):
+        pass
+
+
+@pytest.fixture(scope='session')
+def plugin():
+    '''
+    以 nlcisbn 包的形式导入 src，与Calibre加载插件的方式一致。需要能导入calibre的Python环境。
+    '''
+    pytest.importorskip('calibre')
+    package = sys.modules.get('nlcisbn')
+    if package is None:
+        spec = importlib.util.spec_from_file_location('nlcisbn', os.path.join(SRC, '__init__.py'),
+                                                      submodule_search_locations=[SRC])
+        package = importlib.util.module_from_spec(spec)
+        sys.modules['nlcisbn'] = package
+        spec.loader.exec_module(package)
+    return package
+
+
+@pytest.fixture
+def log():
+    return QuietLog()
@@ -0,0 +1,37 @@
+'''
+原始响应存档的测试。
+'''
+import pytest
+
+RECORD_URL = 'http://opac.nlc.cn:80/F/{session}?func=full-set-set&set_number={set_number}&set_entry=000002&format=001'
+
+
+@pytest.fixture
+def archive(plugin):
+    from nlcisbn import archive
+    return archive
+
+
+def test_archive_key_drops_session(archive):
+    assert (archive.archive_key('http://opac.nlc.cn:80/F/ABC-00101?func=find-b&request=9787111544937')
+            == archive.archive_key('http://opac.nlc.cn/F?func=find-b&request=9787111544937'))
+
+
+def test_record_key_ignores_set_number(archive):
+    recorded = RECORD_URL.format(session='ABC-00101', set_number='012345')
+    replayed = RECORD_URL.format(session='XYZ-00301', set_number='000007')
+    assert archive.archive_key(recorded, '凤凰架构') == archive.archive_key(replayed, '凤凰架构')
+
+
+def test_record_key_separates_searches(archive):
+    url = RECORD_URL.format(session='ABC-00101', set_number='012345')
+    assert archive.archive_key(url, '凤凰架构') != archive.archive_key(url, '9787111544937')
+
+
+def test_put_and_get_by_search(archive, tmp_path):
+    responses = archive.ResponseArchive(str(tmp_path / 'archive.sqlite'))
+    responses.put(RECORD_URL.format(session='ABC-00101', set_number='012345'), '<html>凤凰架构</html>',
+                  search='凤凰架构')
+    replayed = RECORD_URL.format(session='XYZ-00301', set_number='000007')
+    assert responses.get(replayed, search='凤凰架构') == '<html>凤凰架构</html>'
+    assert responses.get(replayed, search='深入理解计算机系统') is None
@@ -0,0 +1,28 @@
+'''
+批量ISBN识别的测试。
+'''
+import pytest
+
+
+@pytest.fixture
+def batch(plugin):
+    from nlcisbn import batch
+    return batch
+
+
+def test_normalize_isbns_dedupes_valid_isbns(batch):
+    assert batch.normalize_isbns(['978-7-111-54493-7', ' 9787111544937 ', '']) == [
+        ('9787111544937', '978-7-111-54493-7'),
+    ]
+
+
+def test_normalize_isbns_keeps_every_invalid_isbn(batch):
+    assert batch.normalize_isbns(['abc', '9787111544937', 'xyz']) == [
+        ('', 'abc'), ('9787111544937', '9787111544937'), ('', 'xyz'),
+    ]
+
+
+def test_identify_many_reports_every_invalid_isbn(batch, log):
+    results = list(batch.identify_many(['bad1', 'bad2'], log=log, rate=0))
+    assert [isbn for isbn, _, _ in results] == ['bad1', 'bad2']
+    assert all(metadata is None and isinstance(error, ValueError) for _, metadata, error in results)
@@ -0,0 +1,17 @@
+'''
+CNMARC字段解析的测试。
+'''
+import pytest
+
+
+@pytest.fixture
+def marc_parser(plugin):
+    from nlcisbn import marc_parser
+    return marc_parser
+
+
+def test_subfield_values_ignores_empty_codes(marc_parser):
+    fields = marc_parser.parse_marc_rows([['200 1', '坏数据 |a 凤凰架构 |e 构建可靠的大型分布式系统'], ['001', '012345']])
+    assert marc_parser.subfield_values(fields, '200', 'a') == ['凤凰架构']
+    assert marc_parser.subfield_values(fields, '200', 'ae') == ['凤凰架构', '构建可靠的大型分布式系统']
+    assert marc_parser.first_subfield(fields, '001', 'a') == ''
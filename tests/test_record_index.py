@@ -0,0 +1,37 @@
+'''
+本地全记录索引的测试。
+'''
+import os
+
+import pytest
+
+from conftest import FIXTURES
+
+
+@pytest.fixture
+def record(plugin, log):
+    with open(os.path.join(FIXTURES, 'full_record_9787111644385.html'), encoding='utf-8') as f:
+        return plugin.parse_record(f.read(), None, log)
+
+
+@pytest.fixture
+def index(plugin, tmp_path):
+    from nlcisbn.record_index import RecordIndex
+    return RecordIndex(str(tmp_path / 'index.sqlite'))
+
+
+def test_search_matches_title_when_authors_differ(index, record):
+    index.add(record)
+    assert [data['isbn'] for _, data in index.search('凤凰架构', ['Zhou Zhiming'])] == [record.isbn]
+
+
+def test_search_ranks_matching_authors_first(index, record):
+    index.add(record)
+    (matched, _), = index.search('凤凰架构', ['周志明'])
+    (unmatched, _), = index.search('凤凰架构', ['Zhou Zhiming'])
+    assert matched > unmatched
+
+
+def test_search_rejects_other_titles(index, record):
+    index.add(record)
+    assert index.search('深入理解计算机系统', ['周志明']) == []
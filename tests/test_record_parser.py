@@ -0,0 +1,45 @@
+'''
+全记录页面解析的回归测试。
+
+对 benchmarks/fixtures 下的每个全记录页面（标准格式 full_record_* 与MARC格式 marc_record_*），
+检查 get_parse_metadata 的结果与 tests/expected 下保存的元数据字典一致。
+中图分类号按原样放入标签，不转换为分类名称，分类名称的解析由 clc_parser 负责。
+'''
+import glob
+import json
+import os
+
+import pytest
+
+from conftest import FIXTURES, EXPECTED
+
+PAGES = sorted(os.path.basename(path)[:-len('.html')]
+               for path in glob.glob(os.path.join(FIXTURES, '*_record_*.html')))
+
+
+@pytest.mark.parametrize('name', PAGES)
+def test_get_parse_metadata(plugin, log, monkeypatch, name):
+    monkeypatch.setattr(plugin, 'CONVERT_CLC_TO_TAG', False)
+    with open(os.path.join(FIXTURES, name + '.html'), encoding='utf-8') as f:
+        html = f.read()
+    with open(os.path.join(EXPECTED, name + '.json'), encoding='utf-8') as f:
+        expected = json.load(f)
+    assert plugin.get_parse_metadata(html, None, log) == expected
+
+
+def test_every_page_has_expected_result():
+    assert PAGES
+    for name in PAGES:
+        assert os.path.exists(os.path.join(EXPECTED, name + '.json')), name
+
+
+@pytest.mark.parametrize('name, year', [
+    ('full_record_9787111544937', '2016'),
+    ('full_record_9787111644385', '2020'),
+    ('marc_record_9787111544937', '2016'),
+    ('marc_record_9787111644385', '2020'),
+])
+def test_year_from_general_data(plugin, log, name, year):
+    with open(os.path.join(FIXTURES, name + '.html'), encoding='utf-8') as f:
+        record = plugin.parse_record(f.read(), None, log)
+    assert record.year == year